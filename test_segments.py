@@ -0,0 +1,165 @@
+"""
+Segmented render: the stream-copied head/tail and the re-encoded window must
+add up to the source, frame for frame (no duplicated or dropped frames at the
+seams), and the joined output must keep the source's timeline.
+Needs FFmpeg on PATH and PyAV.
+"""
+
+import os
+import shutil
+import subprocess
+
+import pytest
+
+import video_brand_automator as engine
+
+av = pytest.importorskip("av")
+
+pytestmark = pytest.mark.skipif(
+    shutil.which(engine.get_binary_path("ffmpeg")) is None,
+    reason="FFmpeg not found",
+)
+
+FPS = 30
+DURATION = 20
+
+
+@pytest.fixture(scope="module")
+def source(tmp_path_factory):
+    """20 s, 30 fps x264 with B-frames and a keyframe every 2 s, plus AAC audio."""
+    path = str(tmp_path_factory.mktemp("src") / "source.mp4")
+    subprocess.run(
+        [
+            engine.get_binary_path("ffmpeg"),
+            "-v",
+            "error",
+            "-f",
+            "lavfi",
+            "-i",
+            f"testsrc2=size=320x240:rate={FPS}",
+            "-f",
+            "lavfi",
+            "-i",
+            "sine=frequency=440:sample_rate=48000",
+            "-t",
+            str(DURATION),
+            "-c:v",
+            "libx264",
+            "-g",
+            str(2 * FPS),
+            "-bf",
+            "3",
+            "-pix_fmt",
+            "yuv420p",
+            "-c:a",
+            "aac",
+            "-y",
+            path,
+        ],
+        check=True,
+    )
+    return path
+
+
+def count_frames(path):
+    with av.open(path) as container:
+        return sum(1 for _ in container.decode(video=0))
+
+
+def test_head_mid_tail_match_source(source, tmp_path):
+    ffmpeg_bin = engine.get_binary_path("ffmpeg")
+    seg_start, seg_end = engine.snap_to_keyframes(source, 10.3, 13.7, DURATION)
+    assert (seg_start, seg_end) == pytest.approx((10.0, 14.0))
+
+    head, tail = engine.split_head_tail(
+        ffmpeg_bin, source, str(tmp_path), seg_start, seg_end, DURATION
+    )
+    # The window, re-encoded the way render_segmented_ffmpeg() cuts it
+    mid = os.path.join(tmp_path, "mid.ts")
+    engine.run_ffmpeg(
+        [
+            ffmpeg_bin,
+            "-ss",
+            engine._ffmpeg_time(seg_start),
+            "-to",
+            engine._ffmpeg_time(seg_end),
+            "-i",
+            source,
+            "-c:v",
+            "libx264",
+            "-y",
+            mid,
+        ]
+    )
+
+    frames = [count_frames(head), count_frames(mid), count_frames(tail)]
+    assert frames == [
+        seg_start * FPS,
+        (seg_end - seg_start) * FPS,
+        (DURATION - seg_end) * FPS,
+    ]
+    assert sum(frames) == count_frames(source)
+
+
+def test_window_at_start_has_no_head(source, tmp_path):
+    head, tail = engine.split_head_tail(
+        engine.get_binary_path("ffmpeg"), source, str(tmp_path), 0.0, 4.0, DURATION
+    )
+    assert head is None
+    assert count_frames(tail) == (DURATION - 4) * FPS
+
+
+@pytest.fixture(scope="module")
+def logo(tmp_path_factory):
+    from PIL import Image
+
+    path = str(tmp_path_factory.mktemp("img") / "logo.png")
+    Image.new("RGBA", (64, 32), (255, 0, 0, 200)).save(path)
+    return path
+
+
+@pytest.mark.parametrize("start_percent", [20, 60])
+@pytest.mark.parametrize("mode", ["ffmpeg", "moviepy"])
+def test_segmented_render_matches_source_timeline(
+    source, logo, tmp_path, mode, start_percent
+):
+    # Windows at 4-7 s and 12-15 s (snapped to 4-8 s, 12-16 s). A seam under
+    # 10 s in is one FFmpeg wouldn't repair on its own, so a misplaced part
+    # shows up as a gap, a repeated timestamp or a longer output.
+    if mode == "moviepy":
+        pytest.importorskip("moviepy")
+    out = str(tmp_path / f"{mode}.mp4")
+    engine.process_single_video(
+        video=source,
+        image=logo,
+        out=out,
+        position="center",
+        scale=None,
+        margin=0.05,
+        start_percent=start_percent,
+        duration_sec=3,
+        fade_in=0,
+        fade_out=0,
+        mode=mode,
+        overwrite=True,
+        threads=2,
+        hw_encoder="none",
+    )
+
+    with av.open(out) as container:
+        stream = container.streams.video[0]
+        time_base = stream.time_base
+        pts = [frame.pts for frame in container.decode(stream)]
+        duration = container.duration / 1_000_000
+    assert len(pts) == count_frames(source)
+    assert pts == sorted(set(pts))
+    assert float(pts[-1] * time_base) == pytest.approx(DURATION - 1 / FPS, abs=0.05)
+    assert duration == pytest.approx(DURATION, abs=0.1)
+
+
+def test_window_encoder_args_match_source(source):
+    args = engine._source_h264_args(source)
+    with av.open(source) as container:
+        ctx = container.streams.video[0].codec_context
+        level = f"{ctx.level / 10:.1f}"
+    assert args == ["-pix_fmt", "yuv420p", "-profile:v", "high", "-level:v", level]
@@ -11,21 +11,25 @@ OBJECTIVE:
     2. MANUAL (CLI): Processes a specific video and image via command line arguments.
 
 DEPENDENCIES:
-    1. Python 3.9+
+    1. Python 3.13+
     2. FFmpeg installed on system PATH.
     3. Libraries: pip install "moviepy>=2.0.0" click
+    4. Optional: pip install av (in-process header reads, and the '--mode pyav' engine)
+    5. Optional: pip install numba (compiles the PyAV engine's blend loop)
 
 USAGE EXAMPLES:
 
-    [A] AUTOMATION MODE (Default - MoviePy Engine)
+    [A] AUTOMATION MODE (Default - FFmpeg Engine)
         1. Create 'videos', 'images', 'output' folders.
         2. Run:
            python video_brand_automator.py
 
-    [B] AUTOMATION MODE (High Performance - FFmpeg Engine)
-        # Use this for large files or if audio sync issues occur.
+    [B] AUTOMATION MODE (MoviePy Engine)
+        # Composites frame-by-frame in Python. Slower, but supports fades.
         # Processes all videos in ./videos using the logo in ./images
-        python video_brand_automator.py --mode ffmpeg --overwrite
+        python video_brand_automator.py --mode moviepy --fade-in 0.5 --overwrite
+        # Same fades, blending only the frames inside the overlay window (needs PyAV)
+        python video_brand_automator.py --mode pyav --fade-in 0.5 --overwrite
 
     [C] AUTOMATION MODE (Custom Folders)
         # Processes all videos in "C:\Raw" using the logo in "C:\Assets"
@@ -42,21 +46,47 @@ USAGE EXAMPLES:
     [F] ADVANCED
         # 50% start time, 3s duration, top-right position
         python video_brand_automator.py --video input.mp4 --image logo.png \
-        --start-percent 50 --duration 3 --position top-right --mode ffmpeg
+        --start-percent 50 --duration 3 --position top-right
+
+    [G] MANIFEST MODE (Parallel Jobs)
+        # jobs.jsonl: {"video": "a.mp4", "image": "logo.png", "out": "a_branded.mp4"}
+        # Any other option (e.g. "position", "scale") can be overridden per line.
+        python video_brand_automator.py --manifest jobs.jsonl --overwrite
 """
 
 import os
+import re
 import sys
-import glob
 import logging
 import subprocess
+import tempfile
+import shutil
+import hashlib
+import struct
+import functools
+import math
+import multiprocessing
+import io
+import collections
+import threading
+import asyncio
+import json
 import click
 import time
-from datetime import timedelta
-from typing import Union, Tuple, Optional, Dict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from fractions import Fraction
+from types import SimpleNamespace
+from typing import Union, Tuple, Optional, Dict, List, Final, Callable
 
+try:
+    import fcntl  # Linux/macOS only, used to enlarge pipe buffers
+except ImportError:
+    fcntl = None
 
-from moviepy import VideoFileClip, ImageClip, CompositeVideoClip, vfx
+try:
+    import numba  # Optional, compiles the PyAV engine's blend kernel
+except ImportError:
+    numba = None
 
 
 # ---------------------------------------------------------------------------
@@ -69,12 +99,141 @@ logging.basicConfig(
 )
 logger = logging.getLogger("VideoAutomator")
 
+# Extensions picked up in batch folders (compared lower-case)
+_VIDEO_EXTS: Final[frozenset] = frozenset({".mp4", ".mov", ".mkv", ".avi", ".webm"})
+_IMG_EXTS: Final[frozenset] = frozenset({".png", ".jpg", ".jpeg", ".webp"})
+
+# Fixed for the process lifetime (used by get_binary_path)
+_SCRIPT_DIR: Final[str] = os.path.dirname(os.path.abspath(__file__))
+_IS_WIN: Final[bool] = sys.platform.startswith("win")
+
+# --hw-encoder choice -> (FFmpeg encoder, input flags, output flags, filter suffix)
+# Order matters: "auto" picks the first hardware encoder FFmpeg was built with.
+VIDEO_ENCODERS: Dict[str, Tuple[str, List[str], List[str], str]] = {
+    "nvenc": (
+        "h264_nvenc",
+        ["-hwaccel", "cuda"],
+        # Constant quality (VBR + CQ 23) instead of NVENC's low default bitrate
+        ["-preset", "p4", "-tune", "ll", "-delay", "0", "-rc", "vbr", "-cq", "23"],
+        "",
+    ),
+    "qsv": ("h264_qsv", [], ["-preset", "faster"], ""),
+    "videotoolbox": ("h264_videotoolbox", [], ["-realtime", "1"], ""),
+    "vaapi": (
+        "h264_vaapi",
+        ["-vaapi_device", "/dev/dri/renderD128"],
+        [],
+        ",format=nv12,hwupload",
+    ),
+    "none": ("libx264", [], [], ""),
+}
+
+# --quality -> (libx264 preset, extra libx264 flags). Shared by both engines.
+X264_QUALITY: Dict[str, Tuple[str, List[str]]] = {
+    "draft": (
+        "ultrafast",
+        [
+            "-tune",
+            "fastdecode,zerolatency",
+            "-bf",
+            "0",
+            "-g",
+            "15",
+            "-x264-params",
+            "rc-lookahead=0:sync-lookahead=0",
+        ],
+    ),
+    "balanced": ("fast", []),
+    "archive": ("slow", ["-crf", "18"]),
+}
+
+# libx264 preset of a segmented render's overlay window at --quality balanced.
+# The window is a few seconds, so a faster preset costs little bitrate.
+_WINDOW_PRESET: Final = "veryfast"
+
+# MP4 index (moov) at the front: outputs start playing before fully downloaded
+_FASTSTART: Final = ["-movflags", "+faststart"]
+
+# --auto-threads: (cpu class, resolution class) -> (threads, libx264 preset).
+# Seeded from x264 benchmarks: small frames stop scaling after a few threads,
+# so spare cores buy a slower (better) preset; 4K needs every core on a fast one.
+PRESET_TABLE: Dict[Tuple[str, str], Tuple[int, str]] = {
+    ("low", "sd"): (2, "veryfast"),
+    ("low", "hd"): (4, "superfast"),
+    ("low", "uhd"): (4, "ultrafast"),
+    ("mid", "sd"): (4, "fast"),
+    ("mid", "hd"): (6, "veryfast"),
+    ("mid", "uhd"): (8, "superfast"),
+    ("high", "sd"): (4, "medium"),
+    ("high", "hd"): (8, "fast"),
+    ("high", "uhd"): (16, "veryfast"),
+}
+
+# Hardware encoders that failed at runtime (listed by FFmpeg but no device)
+_FAILED_ENCODERS = set()
+
+# Named positions -> FFmpeg overlay x/y expressions
+_POS_MAP: Final[Dict[str, str]] = {
+    "center": "x=(W-w)/2:y=(H-h)/2",
+    "top-left": "x=0:y=0",
+    "top-right": "x=W-w:y=0",
+    "bottom-left": "x=0:y=H-h",
+    "bottom-right": "x=W-w:y=H-h",
+}
+
+# "x,y" pixel coordinates (signed, decimals and exponents allowed)
+_NUM: Final[str] = r"\s*([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)\s*"
+_POS_RE: Final[re.Pattern] = re.compile(f"^{_NUM},{_NUM}$")
+
+# Overlay filter graph: [0:v] is the video, [1:v] the pre-scaled overlay.
+# A looped overlay is shifted into its window instead of using an enable=
+# expression, so overlay passes frames outside it straight through.
+# Times are integer milliseconds.
+_TIMED_OVERLAY_FILTER: Final[str] = (
+    "[1:v]loop=loop=-1:size=1,trim=duration={dur_ms}ms,"
+    "setpts=PTS-STARTPTS+{start_ms}/1000/TB[ovr];"
+    "[0:v][ovr]overlay={xy}:eof_action=pass{suffix}"
+)
+
+# NVENC with CUDA frames: decode, overlay and encode without leaving the GPU.
+# The overlay is uploaded once; only the per-frame blend runs (on the GPU).
+_CUDA_INPUT_ARGS: Final[List[str]] = [
+    "-init_hw_device",
+    "cuda=gpu",
+    "-filter_hw_device",
+    "gpu",
+    "-hwaccel",
+    "cuda",
+    "-hwaccel_device",
+    "gpu",
+    "-hwaccel_output_format",
+    "cuda",
+]
+_CUDA_OVERLAY_FILTER: Final[str] = (
+    "[1:v]loop=loop=-1:size=1,trim=duration={dur_ms}ms,"
+    "setpts=PTS-STARTPTS+{start_ms}/1000/TB,format=yuva420p,hwupload_cuda[ovr];"
+    "[0:v][ovr]overlay_cuda={xy}:eof_action=pass"
+)
+
+# Finished outputs keyed by input content + render settings (see _cache_key)
+CACHE_DIR: Final[str] = os.path.join(
+    os.path.expanduser("~"), ".cache", "video_brand_automator"
+)
+_CACHE_SAMPLE: Final[int] = 1024 * 1024
+# Bounds of the output cache: least recently used entries go first
+CACHE_MAX_BYTES: Final[int] = 5 * 1024**3
+CACHE_MAX_AGE: Final[float] = 30 * 24 * 3600.0
+
+# probe_video() results keyed by (absolute path, mtime)
+_PROBE_CACHE: Dict[Tuple[str, float], Dict[str, Union[int, float, str]]] = {}
+
 
 # ---------------------------------------------------------------------------
 # CORE LOGIC
 # ---------------------------------------------------------------------------
 
 
+@functools.lru_cache(maxsize=8)
 def get_binary_path(binary_name: str) -> str:
     """
     Smartly resolves the path to external tools (ffmpeg/ffprobe).
@@ -83,11 +242,10 @@ def get_binary_path(binary_name: str) -> str:
     2. Look in system PATH.
     """
     # 1. Check local folder (e.g., C:\Users\...\video_edit\ffmpeg.exe)
-    base_dir = os.path.dirname(os.path.abspath(__file__))
-    local_path = os.path.join(base_dir, binary_name)
+    local_path = os.path.join(_SCRIPT_DIR, binary_name)
 
     # Windows requires .exe extension check
-    if sys.platform.startswith("win"):
+    if _IS_WIN:
         if not local_path.lower().endswith(".exe"):
             local_path += ".exe"
 
@@ -98,6 +256,50 @@ def get_binary_path(binary_name: str) -> str:
     return binary_name
 
 
+@functools.lru_cache(maxsize=4)
+def _list_ffmpeg_components(flag: str) -> frozenset:
+    """Returns the names FFmpeg lists for '-encoders' or '-filters'. Probed once."""
+    cmd = [get_binary_path("ffmpeg"), "-hide_banner", flag]
+    try:
+        out = subprocess.run(cmd, capture_output=True, check=True).stdout
+    except (OSError, subprocess.CalledProcessError):
+        return frozenset()
+
+    # Lines look like: " V....D h264_nvenc   NVIDIA NVENC H.264 encoder"
+    lines = out.decode("utf-8", errors="ignore").splitlines()
+    return frozenset(parts[1] for parts in map(str.split, lines) if len(parts) > 1)
+
+
+def get_available_encoders() -> frozenset:
+    """Returns the encoder names compiled into FFmpeg."""
+    return _list_ffmpeg_components("-encoders")
+
+
+def get_available_filters() -> frozenset:
+    """Returns the filter names compiled into FFmpeg."""
+    return _list_ffmpeg_components("-filters")
+
+
+def resolve_hw_encoder(choice: str) -> str:
+    """
+    Resolves a --hw-encoder choice to a key of VIDEO_ENCODERS.
+    'auto' picks the first available hardware encoder, falling back to 'none' (libx264).
+    """
+    available = get_available_encoders()
+
+    if choice == "auto":
+        for key, (encoder, _, _, _) in VIDEO_ENCODERS.items():
+            if key != "none" and key not in _FAILED_ENCODERS and encoder in available:
+                return key
+        return "none"
+
+    encoder = VIDEO_ENCODERS[choice][0]
+    if choice != "none" and encoder not in available:
+        logger.warning(f"FFmpeg has no '{encoder}' encoder. Using libx264.")
+        return "none"
+    return choice
+
+
 def get_overlay_timing(
     video_duration: float, start_pct: float, target_duration: float
 ) -> Tuple[float, float]:
@@ -132,22 +334,71 @@ def calculate_smart_scale(
       4. Use the smaller scale factor to ensure it fits entirely (Aspect Ratio Preserved).
     """
     vw, vh = video_size
-    iw, ih = image_size
+    iw, ih = float(image_size[0]), float(image_size[1])
 
     # Calculate safe area (subtracting margin from both sides)
     # margin_pct is 0.05 for 5%.
     safe_w = vw * (1.0 - (2 * margin_pct))
     safe_h = vh * (1.0 - (2 * margin_pct))
 
-    # Calculate scale needed for width and height
-    scale_w = safe_w / iw
-    scale_h = safe_h / ih
-
     # Choose the smaller scale to ensure it fits within BOTH dimensions
     # This effectively "matches" the video width or height, whichever is the constraint.
-    final_scale = min(scale_w, scale_h)
+    # safe_w / iw < safe_h / ih, cross-multiplied: one compare, then one divide.
+    if safe_w * ih < safe_h * iw:
+        return safe_w / iw
+    return safe_h / ih
+
+
+def x264_settings(
+    quality: str, preset: Optional[str] = None, crf: Optional[int] = None
+) -> Tuple[str, List[str]]:
+    """(preset, extra flags) for a --quality, with --encode-preset/--crf on top."""
+    quality_preset, x264_params = X264_QUALITY[quality]
+    x264_params = list(x264_params)
+    if crf is not None:
+        if "-crf" in x264_params:
+            x264_params[x264_params.index("-crf") + 1] = str(crf)
+        else:
+            x264_params += ["-crf", str(crf)]
+    return preset or quality_preset, x264_params
+
+
+def pick_threads_and_preset(width: int, height: int) -> Tuple[int, str]:
+    """
+    Looks up (threads, preset) in PRESET_TABLE for this machine and frame size.
+    """
+    cores = os.process_cpu_count() or 4
+    cpu_class = "low" if cores <= 4 else "mid" if cores <= 8 else "high"
+
+    pixels = width * height
+    if pixels < 1280 * 720:
+        resolution_class = "sd"
+    elif pixels <= 2560 * 1440:
+        resolution_class = "hd"
+    else:
+        resolution_class = "uhd"
 
-    return final_scale
+    threads, preset = PRESET_TABLE[(cpu_class, resolution_class)]
+    return min(threads, cores), preset
+
+
+@functools.cache
+def _moviepy() -> SimpleNamespace:
+    """
+    Imports MoviePy on first use. It pulls in numpy/imageio/proglog, which
+    the FFmpeg engine never needs, so the CLI starts faster without it.
+    """
+    try:
+        from moviepy import VideoFileClip, ImageClip, CompositeVideoClip, vfx
+    except ImportError:
+        raise RuntimeError('MoviePy engine needs: pip install "moviepy>=2.0.0"')
+
+    return SimpleNamespace(
+        VideoFileClip=VideoFileClip,
+        ImageClip=ImageClip,
+        CompositeVideoClip=CompositeVideoClip,
+        vfx=vfx,
+    )
 
 
 def mode_moviepy(
@@ -161,35 +412,54 @@ def mode_moviepy(
     margin: float,
     fade_in: float,
     fade_out: float,
-    threads: int,
+    threads: Optional[int],
+    quality: str = "balanced",
+    preset: Optional[str] = None,
+    image_bytes: Optional[bytes] = None,
+    crf: Optional[int] = None,
 ):
-    try:
-        video = VideoFileClip(video_path)
-    except Exception as e:
-        raise RuntimeError(f"Could not load video {video_path}: {e}")
-
+    # --- TIMING LOGIC ---
+    # Probe the header first (cached), a skipped overlay never needs the MoviePy decoder.
+    v_info = probe_video(video_path)
     logger.info(
-        f"Video: {os.path.basename(video_path)} | Size: {video.size} | Duration: {video.duration:.2f}s"
+        f"Video: {os.path.basename(video_path)} | Size: ({v_info['width']}, {v_info['height']}) | Duration: {v_info['duration']:.2f}s"
     )
-
-    # --- TIMING LOGIC ---
-    start_t, dur_t = get_overlay_timing(video.duration, start_pct, duration_sec)
+    start_t, dur_t = get_overlay_timing(v_info["duration"], start_pct, duration_sec)
 
     if dur_t <= 0:
-        logger.warning("Overlay skipped (Start time is after video ends).")
-        if video.audio:
-            video.write_videofile(
-                output_path, codec="libx264", audio_codec="aac", logger=None
-            )
-        else:
-            video.write_videofile(output_path, codec="libx264", logger=None)
+        logger.warning(
+            "Overlay skipped (Start time is after video ends). Copying stream."
+        )
+        copy_video_stream(video_path, output_path, overwrite=True)
         return
 
+    mp = _moviepy()
+    try:
+        source = mp.VideoFileClip(video_path)
+    except Exception as e:
+        raise RuntimeError(f"Could not load video {video_path}: {e}")
+
     logger.info(f"Overlay Timing: Start={start_t:.2f}s | Duration={dur_t:.2f}s")
 
+    # Short overlay on a long H.264 video: MoviePy composites only the overlay
+    # window, FFmpeg stream-copies the rest (same split as the FFmpeg engine)
+    segmented = v_info["codec"] == "h264" and dur_t < v_info["duration"] * 0.5
+    if segmented:
+        seg_start, seg_end = snap_to_keyframes(
+            video_path, start_t, start_t + dur_t, v_info["duration"]
+        )
+        video = source.subclipped(seg_start, seg_end)
+        overlay_start = start_t - seg_start
+    else:
+        video = source
+        overlay_start = start_t
+
     # --- IMAGE PREPARATION ---
-    # FIX 1: Set duration immediately on the image clip
-    img = ImageClip(image_path).with_duration(dur_t)
+    # Resized once with Pillow (area filter) before it becomes a clip, instead
+    # of MoviePy's Resize effect
+    import numpy as np  # Installed with MoviePy
+
+    overlay = load_overlay_image(image_bytes or image_path)
 
     # Smart Resizing
     target_scale = 1.0
@@ -197,55 +467,92 @@ def mode_moviepy(
         target_scale = scale
     else:
         target_scale = calculate_smart_scale(
-            (video.size[0], video.size[1]), (img.size[0], img.size[1]), margin
+            (video.size[0], video.size[1]), overlay.size, margin
         )
         logger.info(f"Auto-calculated scale: {target_scale:.3f}")
 
-    img = img.with_effects([vfx.Resize(target_scale)])
+    # FIX 1: Set duration immediately on the image clip
+    img = mp.ImageClip(np.array(resize_overlay(overlay, target_scale)))
+    img = img.with_duration(dur_t)
 
     # FIX 2: Apply position and start time AFTER duration is set
-    img = img.with_start(start_t).with_position(position)
+    img = img.with_start(overlay_start).with_position(position)
 
     # Fades
     effects = []
     if fade_in > 0:
-        effects.append(vfx.CrossFadeIn(fade_in))
+        effects.append(mp.vfx.CrossFadeIn(fade_in))
     if fade_out > 0:
-        effects.append(vfx.CrossFadeOut(fade_out))
+        effects.append(mp.vfx.CrossFadeOut(fade_out))
     if effects:
         img = img.with_effects(effects)
 
     # --- COMPOSITING FIX ---
     # FIX 3: Do not use use_bgclip=True alone. Explicitly build the composite.
     # We layer [video, img].
-    final = CompositeVideoClip([video, img], size=video.size)
+    final = mp.CompositeVideoClip([video, img], size=video.size)
 
     # FIX 4: Explicitly force the Duration and FPS to match the source video
     # This prevents the "Freeze" where the compositor thinks the video ended early.
     final = final.with_duration(video.duration).with_fps(video.fps)
 
-    # Audio Sync
-    if video.audio:
-        final = final.with_audio(video.audio)
+    # Audio: not attached here. MoviePy would decode it to memory and re-encode
+    # it; the source's audio is stream-copied next to the render instead.
 
     # Render
-    logger.info(f"Rendering -> {output_path}")
-    final.write_videofile(
-        output_path,
-        codec="libx264",
-        audio_codec="aac",
-        threads=threads,
-        preset="fast",
-        logger="bar" if sys.stdout.isatty() else None,
-    )
+    x264_preset, x264_params = x264_settings(quality, preset, crf)
+    write_args = {
+        "codec": "libx264",
+        "threads": threads,
+        "preset": x264_preset,
+        "ffmpeg_params": x264_params,
+        "logger": "bar" if sys.stdout.isatty() else None,
+    }
 
-    video.close()
+    if segmented:
+        ffmpeg_bin = get_binary_path("ffmpeg")
+
+        def render_mid(mid_path: str):
+            # Video only: stitch_segments() takes the audio from the source.
+            # On the source's timeline, like the stream-copied head and tail.
+            final.write_videofile(
+                mid_path,
+                audio=False,
+                **{
+                    **write_args,
+                    "ffmpeg_params": [
+                        *x264_params,
+                        "-output_ts_offset",
+                        _ffmpeg_time(seg_start),
+                    ],
+                },
+            )
+
+        logger.info(f"Rendering (overlay window only) -> {output_path}")
+        stitch_segments(
+            ffmpeg_bin,
+            video_path,
+            output_path,
+            seg_start,
+            seg_end,
+            v_info["duration"],
+            True,
+            render_mid,
+        )
+    else:
+        logger.info(f"Rendering -> {output_path}")
+        with tempfile.TemporaryDirectory(prefix="vba_") as tmp_dir:
+            video_only_path = os.path.join(tmp_dir, "video.mp4")
+            final.write_videofile(video_only_path, audio=False, **write_args)
+            mux_source_audio(video_only_path, video_path, output_path)
+
+    source.close()
     img.close()
     final.close()
 
 
-def get_media_info_ffmpeg(path: str) -> Dict[str, Union[int, float]]:
-    """Helper: Returns duration, width, height using ffprobe."""
+def get_media_info_ffmpeg(path: str) -> Dict[str, Union[int, float, str]]:
+    """Helper: Returns codec, duration, width, height using ffprobe."""
     # CHANGED: Use helper to find ffprobe
     ffprobe_bin = get_binary_path("ffprobe")
 
@@ -256,21 +563,23 @@ def get_media_info_ffmpeg(path: str) -> Dict[str, Union[int, float]]:
         "-select_streams",
         "v:0",
         "-show_entries",
-        "stream=width,height,duration",
+        "stream=codec_name,width,height,duration",
         "-of",
-        "default=noprint_wrappers=1:nokey=1",
+        "default=noprint_wrappers=1",
         path,
     ]
     try:
-        # Output format is usually: width\nheight\nduration
-        out = subprocess.check_output(cmd).decode("utf-8").strip().splitlines()
-        if len(out) >= 3:
-            return {
-                "width": int(out[0]),
-                "height": int(out[1]),
-                "duration": float(out[2]),
-            }
-        return {"width": int(out[0]), "height": int(out[1]), "duration": 0.0}
+        # Output format is: key=value per line (duration may be "N/A")
+        # Parsed as bytes: int()/float() accept ASCII bytes, no UTF-8 decode needed.
+        out = subprocess.check_output(cmd).strip().splitlines()
+        fields = dict(line.split(b"=", 1) for line in out if b"=" in line)
+        duration = fields.get(b"duration", b"N/A")
+        return {
+            "codec": fields.get(b"codec_name", b"").decode("ascii"),
+            "width": int(fields[b"width"]),
+            "height": int(fields[b"height"]),
+            "duration": float(duration) if duration != b"N/A" else 0.0,
+        }
     except FileNotFoundError:
         # Specific error if ffprobe.exe is still missing
         raise RuntimeError(f"Could not find '{ffprobe_bin}'. Did you download FFmpeg?")
@@ -278,6 +587,754 @@ def get_media_info_ffmpeg(path: str) -> Dict[str, Union[int, float]]:
         raise RuntimeError(f"FFprobe failed for {path}: {e}")
 
 
+# ISO BMFF (MP4/MOV) sample entry -> FFmpeg codec name
+_MP4_CODECS: Final = {
+    b"avc1": "h264",
+    b"avc3": "h264",
+    b"hvc1": "hevc",
+    b"hev1": "hevc",
+    b"av01": "av1",
+    b"vp09": "vp9",
+    b"mp4v": "mpeg4",
+    b"apcn": "prores",
+    b"apch": "prores",
+}
+_MP4_EXTS: Final = frozenset({".mp4", ".mov", ".m4v"})
+_MAX_MOOV_SIZE: Final = 16 * 1024 * 1024
+
+
+def _mp4_boxes(data: bytes, start: int = 0, end: Optional[int] = None):
+    """Yields (type, payload start, payload end) of the boxes in data[start:end]."""
+    end = len(data) if end is None else end
+    while start + 8 <= end:
+        size, box_type = struct.unpack_from(">I4s", data, start)
+        header = 8
+        if size == 1:  # 64-bit size follows
+            size = struct.unpack_from(">Q", data, start + 8)[0]
+            header = 16
+        elif size == 0:  # Box runs to the end
+            size = end - start
+        if size < header or start + size > end:
+            return
+        yield box_type, start + header, start + size
+        start += size
+
+
+def _mp4_child(data: bytes, parent: Tuple[int, int], box_type: bytes):
+    for child_type, child_start, child_end in _mp4_boxes(data, *parent):
+        if child_type == box_type:
+            return child_start, child_end
+    return None
+
+
+def _next_box(f) -> Optional[Tuple[bytes, int, int]]:
+    """Reads a top-level box header: (type, size, header size), f at its payload."""
+    header = f.read(8)
+    if len(header) < 8:
+        return None
+    size, box_type = struct.unpack(">I4s", header)
+    header_size = 8
+    if size == 1:  # 64-bit size follows
+        size = struct.unpack(">Q", f.read(8))[0]
+        header_size = 16
+    if size < header_size:  # size 0 (to end of file) or corrupt
+        return None
+    return box_type, size, header_size
+
+
+def _read_moov(f) -> Optional[bytes]:
+    """Walks the top-level box headers (seeking past mdat) and reads 'moov'."""
+    while (box := _next_box(f)) is not None:
+        box_type, size, header_size = box
+        if box_type == b"moov":
+            return f.read(size - header_size) if size <= _MAX_MOOV_SIZE else None
+        f.seek(size - header_size, os.SEEK_CUR)
+    return None
+
+
+def _is_faststart(path: str) -> bool:
+    """True if an MP4/MOV has its index (moov) ahead of the media data (mdat)."""
+    try:
+        with open(path, "rb") as f:
+            while (box := _next_box(f)) is not None:
+                box_type, size, header_size = box
+                if box_type in (b"moov", b"mdat"):
+                    return box_type == b"moov"
+                f.seek(size - header_size, os.SEEK_CUR)
+    except (OSError, struct.error):
+        pass
+    return False
+
+
+def _mp4_info(path: str) -> Optional[Dict[str, Union[int, float, str]]]:
+    """
+    Codec, duration, width, height of the first video track of an MP4/MOV,
+    read straight from the 'moov' box (ISO/IEC 14496-12) with struct: one
+    open() and a few reads, no decoder library, no subprocess.
+    Returns None when the file is not a plain MP4/MOV (caller falls back).
+    """
+    try:
+        with open(path, "rb") as f:
+            moov = _read_moov(f)
+        return _parse_moov(moov) if moov else None
+    except (OSError, struct.error, IndexError, ValueError):  # Unreadable/corrupt
+        return None
+
+
+def _parse_moov(moov: bytes) -> Optional[Dict[str, Union[int, float, str]]]:
+    """_mp4_info() on the payload of a 'moov' box."""
+    # Every field read below is bounds-checked against its own box first: a
+    # truncated box gives None (FFmpeg fallback), not a read of its neighbour
+    mvhd = _mp4_child(moov, (0, len(moov)), b"mvhd")
+    if not mvhd or mvhd[0] == mvhd[1]:
+        return None
+    offset = mvhd[0] + (20 if moov[mvhd[0]] == 1 else 12)
+    if offset + 4 > mvhd[1]:
+        return None
+    movie_timescale = struct.unpack_from(">I", moov, offset)[0]
+    for box_type, start, end in _mp4_boxes(moov):
+        if box_type != b"trak":
+            continue
+        mdia = _mp4_child(moov, (start, end), b"mdia")
+        hdlr = mdia and _mp4_child(moov, mdia, b"hdlr")
+        # hdlr payload: version/flags (4), pre_defined (4), handler_type (4)
+        if not hdlr or moov[hdlr[0] + 8 : hdlr[0] + 12] != b"vide":
+            continue
+
+        # mdhd: track timescale + duration (32-bit in version 0, 64-bit in 1)
+        mdhd = _mp4_child(moov, mdia, b"mdhd")
+        minf = _mp4_child(moov, mdia, b"minf")
+        stbl = minf and _mp4_child(moov, minf, b"stbl")
+        stsd = stbl and _mp4_child(moov, stbl, b"stsd")
+        if not mdhd or not stsd or mdhd[0] == mdhd[1]:
+            return None
+        if mdhd[0] + (32 if moov[mdhd[0]] == 1 else 20) > mdhd[1]:
+            return None
+        if moov[mdhd[0]] == 1:
+            timescale, duration = struct.unpack_from(">IQ", moov, mdhd[0] + 20)
+        else:
+            timescale, duration = struct.unpack_from(">II", moov, mdhd[0] + 12)
+
+        # stsd: version/flags (4), entry count (4), then the first sample entry:
+        # size (4), format (4), reserved (6), data ref (2), pre_defined (16), w, h
+        entry = stsd[0] + 8
+        if entry + 36 > stsd[1]:
+            return None
+        codec = _MP4_CODECS.get(moov[entry + 4 : entry + 8])
+        # Fragmented MP4s keep their samples (and duration) outside moov
+        if codec is None or not timescale or not duration:
+            return None
+        width, height = struct.unpack_from(">HH", moov, entry + 32)
+        seconds = duration / timescale
+
+        # Edit list: the usual single edit spans the whole track. Anything else
+        # (e.g. a stream-copy cut that hides part of the media) is left to FFmpeg.
+        edts = _mp4_child(moov, (start, end), b"edts")
+        elst = edts and _mp4_child(moov, edts, b"elst")
+        if elst:
+            if elst[0] + 8 > elst[1]:
+                return None
+            version = moov[elst[0]]
+            count = struct.unpack_from(">I", moov, elst[0] + 4)[0]
+            fmt = ">Qq" if version == 1 else ">Ii"
+            entry_size = 20 if version == 1 else 12
+            if elst[0] + 8 + count * entry_size > elst[1]:
+                return None
+            edits = [
+                struct.unpack_from(fmt, moov, elst[0] + 8 + i * entry_size)
+                for i in range(count)
+            ]
+            edits = [edit for edit in edits if edit[1] != -1]  # -1: empty edit
+            if len(edits) > 1 or not movie_timescale:
+                return None
+            if edits and abs(edits[0][0] / movie_timescale - seconds) > 0.1:
+                return None
+
+        return {
+            "codec": codec,
+            "width": width,
+            "height": height,
+            "duration": seconds,
+        }
+    return None
+
+
+def probe_video(path: str) -> Dict[str, Union[int, float, str]]:
+    """
+    Returns codec, duration, width, height of a video.
+    MP4/MOV headers are parsed directly (_mp4_info). Other files are read
+    in-process with PyAV when installed (no ffprobe spawn), otherwise with
+    ffprobe. Memoized per (path, mtime).
+    """
+    key = (os.path.abspath(path), os.path.getmtime(path))
+    if key in _PROBE_CACHE:
+        return _PROBE_CACHE[key]
+
+    if os.path.splitext(path)[1].lower() in _MP4_EXTS:
+        info = _mp4_info(path)
+        if info is not None:
+            _PROBE_CACHE[key] = info
+            return info
+
+    try:
+        import av
+    except ImportError:
+        info = get_media_info_ffmpeg(path)
+    else:
+        try:
+            with av.open(path) as container:
+                stream = container.streams.video[0]
+                # Prefer the video stream's duration (what ffprobe reports above),
+                # else the container's (AV_TIME_BASE units, microseconds)
+                if stream.duration and stream.time_base:
+                    duration = float(stream.duration * stream.time_base)
+                elif container.duration:
+                    duration = container.duration / 1_000_000.0
+                else:
+                    duration = 0.0
+                info = {
+                    "codec": stream.codec_context.name,
+                    "width": stream.codec_context.width,
+                    "height": stream.codec_context.height,
+                    "duration": duration,
+                }
+        except (av.FFmpegError, IndexError):
+            # Let ffprobe report the error (or succeed where PyAV's build can't)
+            info = get_media_info_ffmpeg(path)
+
+    _PROBE_CACHE[key] = info
+    return info
+
+
+def prefetch_probes(paths: List[str], concurrency: int = 16):
+    """
+    Fills probe_video()'s cache for many videos at once. Header reads (or
+    ffprobe runs) overlap instead of queuing one after another; errors are
+    left for the later probe_video() call to report.
+    """
+
+    async def probe_all():
+        gate = asyncio.Semaphore(concurrency)
+
+        async def probe(path: str):
+            async with gate:
+                try:
+                    await asyncio.to_thread(probe_video, path)
+                except (OSError, RuntimeError):
+                    pass
+
+        await asyncio.gather(*(probe(path) for path in paths))
+
+    asyncio.run(probe_all())
+
+
+def load_overlay_image(image: Union[str, bytes]):
+    """
+    Opens the overlay (file path or encoded bytes) as an RGBA Pillow image.
+    Pillow ships with MoviePy.
+    """
+    from PIL import Image
+
+    source = io.BytesIO(image) if isinstance(image, bytes) else image
+    with Image.open(source) as img:
+        return img.convert("RGBA")
+
+
+def resize_overlay(image, scale: float):
+    """
+    Resizes the overlay once: area filter when shrinking, bilinear when enlarging.
+    """
+    from PIL import Image
+
+    new_size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+    resample = Image.Resampling.BOX if scale < 1 else Image.Resampling.BILINEAR
+    return image.resize(new_size, resample)
+
+
+def encode_png(image) -> bytes:
+    """Encodes a Pillow image as PNG in memory (fed to FFmpeg through stdin)."""
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG")
+    return buffer.getvalue()
+
+
+@functools.lru_cache(maxsize=16)
+def _scaled_overlay_png(
+    image: Union[str, bytes],
+    image_mtime: Optional[float],
+    frame_size: Tuple[int, int],
+    scale: Optional[float],
+    margin: float,
+) -> Tuple[bytes, float]:
+    """Cached body of get_scaled_overlay_png() (image_mtime only keys the cache)."""
+    overlay = load_overlay_image(image)
+    if scale is None:
+        scale = calculate_smart_scale(frame_size, overlay.size, margin)
+    return encode_png(resize_overlay(overlay, scale)), scale
+
+
+def get_scaled_overlay_png(
+    image: Union[str, bytes],
+    frame_size: Tuple[int, int],
+    scale: Optional[float],
+    margin: float,
+) -> Tuple[bytes, float]:
+    """
+    Returns (PNG bytes, scale used) of the overlay sized for frame_size.
+    Memoized, so a batch of same-resolution videos decodes/resizes/encodes the
+    logo once. File paths are keyed with their mtime to pick up edits.
+    """
+    image_mtime = None if isinstance(image, bytes) else os.path.getmtime(image)
+    return _scaled_overlay_png(image, image_mtime, frame_size, scale, margin)
+
+
+def _grow_pipe_buffer(fd: int, size: int):
+    """
+    Linux: enlarges a pipe buffer (capped by /proc/sys/fs/pipe-max-size) so a
+    large overlay is written in one go instead of many small blocking writes.
+    """
+    if fcntl is None or not hasattr(fcntl, "F_SETPIPE_SZ"):
+        return
+    try:
+        with open("/proc/sys/fs/pipe-max-size") as f:
+            max_size = int(f.read())
+        fcntl.fcntl(fd, fcntl.F_SETPIPE_SZ, min(size, max_size))
+    except (OSError, ValueError):
+        pass  # Keep the default 64KB buffer
+
+
+def _drain_stderr(stream, tail: collections.deque):
+    """Reads FFmpeg's stderr as it arrives, so the child never blocks on it."""
+    for raw in stream:
+        line = raw.decode("utf-8", errors="replace").rstrip()
+        if line:
+            tail.append(line)
+            logger.debug(f"ffmpeg: {line}")
+
+
+def run_ffmpeg(cmd: List[str], stdin_data: Optional[bytes] = None):
+    """
+    Runs an FFmpeg command, optionally feeding 'pipe:0' from memory.
+    Only errors are printed by FFmpeg; they are read on a thread (debug log)
+    and logged when the command fails. Raises CalledProcessError on failure.
+    """
+    cmd = [cmd[0], "-hide_banner", "-loglevel", "error", *cmd[1:]]
+    proc = subprocess.Popen(
+        cmd,
+        stdin=subprocess.DEVNULL if stdin_data is None else subprocess.PIPE,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    errors = collections.deque(maxlen=20)
+    drain = threading.Thread(target=_drain_stderr, args=(proc.stderr, errors))
+    drain.daemon = True
+    drain.start()
+
+    if stdin_data is not None:
+        _grow_pipe_buffer(proc.stdin.fileno(), len(stdin_data))
+        try:
+            proc.stdin.write(stdin_data)
+            proc.stdin.close()
+        except BrokenPipeError:
+            pass  # FFmpeg exited early, its return code says why
+
+    proc.wait()
+    drain.join()
+    if proc.returncode != 0:
+        for line in errors:
+            logger.error(f"ffmpeg: {line}")
+        raise subprocess.CalledProcessError(
+            proc.returncode, cmd, stderr="\n".join(errors)
+        )
+
+
+def copy_video_stream(video_path: str, output_path: str, overwrite: bool):
+    """
+    Copies every stream into the output without re-encoding.
+    Used when the overlay is skipped: costs a disk copy, not a transcode.
+    """
+    # Same container, already faststart: a plain file copy, no FFmpeg process
+    ext = os.path.splitext(video_path)[1].lower()
+    if ext == os.path.splitext(output_path)[1].lower() and (
+        ext not in _MP4_EXTS or _is_faststart(video_path)
+    ):
+        if overwrite or not os.path.exists(output_path):
+            shutil.copyfile(video_path, output_path)
+        return
+
+    cmd = [
+        get_binary_path("ffmpeg"),
+        "-i",
+        video_path,
+        "-c",
+        "copy",
+        "-map",
+        "0",
+        *_FASTSTART,
+        "-y" if overwrite else "-n",
+        output_path,
+    ]
+    run_ffmpeg(cmd)
+
+
+def mux_source_audio(video_only_path: str, source_path: str, output_path: str):
+    """Pairs a video-only render with the source's audio, stream-copied."""
+    cmd = [
+        get_binary_path("ffmpeg"),
+        "-i",
+        video_only_path,
+        "-i",
+        source_path,
+        "-map",
+        "0:v",
+        "-map",
+        "1:a?",
+        "-c",
+        "copy",
+        "-shortest",
+        *_FASTSTART,
+        "-y",
+        output_path,
+    ]
+    run_ffmpeg(cmd)
+
+
+def _keyframes_near(path: str, start_t: float, end_t: float) -> List[float]:
+    """
+    Keyframe times from the last one before start_t to the first one after end_t.
+    Seeks to start_t and reads packets only (no decode), so cost is ~one GOP.
+    """
+    try:
+        import av
+    except ImportError:
+        av = None
+
+    if av is not None:
+        try:
+            with av.open(path) as container:
+                stream = container.streams.video[0]
+                container.seek(
+                    int(start_t / stream.time_base), stream=stream, backward=True
+                )
+                times = []
+                for packet in container.demux(stream):
+                    if packet.pts is None or not packet.is_keyframe:
+                        continue
+                    times.append(float(packet.pts * stream.time_base))
+                    if times[-1] >= end_t:
+                        break
+                return times
+        except (av.FFmpegError, IndexError):
+            pass  # ffprobe below
+
+    # ffprobe seeks the same way with -read_intervals; lines are "pts_time,flags"
+    cmd = [
+        get_binary_path("ffprobe"),
+        "-v",
+        "error",
+        "-select_streams",
+        "v:0",
+        "-read_intervals",
+        f"{start_t:.3f}%{end_t + 30:.3f}",
+        "-show_entries",
+        "packet=pts_time,flags",
+        "-of",
+        "csv=p=0",
+        path,
+    ]
+    try:
+        out = subprocess.check_output(cmd).splitlines()
+    except (OSError, subprocess.CalledProcessError):
+        return []
+    return [
+        float(pts)
+        for pts, _, flags in (line.partition(b",") for line in out)
+        if flags.startswith(b"K") and pts != b"N/A"
+    ]
+
+
+# FFmpeg H.264 profile name -> libx264 -profile:v
+_X264_PROFILES: Final = {
+    "Baseline": "baseline",
+    "Constrained Baseline": "baseline",
+    "Main": "main",
+    "High": "high",
+    "High 10": "high10",
+    "High 4:2:2": "high422",
+    "High 4:4:4 Predictive": "high444",
+}
+
+
+def _source_h264_args(path: str) -> List[str]:
+    """
+    libx264 -pix_fmt/-profile:v/-level:v of the source's video stream, so a
+    re-encoded window has the same parameter sets as the stream-copied head
+    and tail it is joined with. Whatever can't be read is left out.
+    """
+    try:
+        import av
+    except ImportError:
+        av = None
+
+    fields = None
+    if av is not None:
+        try:
+            with av.open(path) as container:
+                ctx = container.streams.video[0].codec_context
+                fields = {
+                    "profile": ctx.profile or "",
+                    "level": ctx.level,
+                    "pix_fmt": ctx.format.name if ctx.format else "",
+                }
+        except (av.FFmpegError, IndexError):
+            pass  # ffprobe below
+
+    if fields is None:
+        cmd = [
+            get_binary_path("ffprobe"),
+            "-v",
+            "error",
+            "-select_streams",
+            "v:0",
+            "-show_entries",
+            "stream=profile,level,pix_fmt",
+            "-of",
+            "default=noprint_wrappers=1",
+            path,
+        ]
+        try:
+            out = subprocess.check_output(cmd).decode("ascii", "replace")
+        except (OSError, subprocess.CalledProcessError):
+            return []
+        fields = dict(line.split("=", 1) for line in out.splitlines() if "=" in line)
+        try:
+            fields["level"] = int(fields.get("level", ""))
+        except ValueError:
+            fields["level"] = 0
+
+    args = []
+    if fields["pix_fmt"]:
+        args += ["-pix_fmt", fields["pix_fmt"]]
+    if fields["profile"] in _X264_PROFILES:
+        args += ["-profile:v", _X264_PROFILES[fields["profile"]]]
+    # FFmpeg reports level_idc (31 = 3.1); 9 is level 1b, which x264 won't take
+    if fields["level"] and fields["level"] >= 10:
+        args += ["-level:v", f"{fields['level'] / 10:.1f}"]
+    return args
+
+
+def _ffmpeg_time(t: float) -> str:
+    """
+    Seconds for -ss/-to/-segment_times with ms precision, rounded down so a
+    cut placed on a keyframe never lands past it.
+    """
+    return f"{math.floor(t * 1000) / 1000:.3f}"
+
+
+def snap_to_keyframes(
+    path: str, start_t: float, end_t: float, total_duration: float
+) -> Tuple[float, float]:
+    """
+    Widens [start_t, end_t) to the keyframes around it, so the stream-copied
+    head and tail split on GOP boundaries (no duplicated or broken frames).
+    """
+    keyframes = _keyframes_near(path, start_t, end_t)
+    if not keyframes:
+        return start_t, end_t  # Unknown, cut where asked
+    seg_start = max((k for k in keyframes if k <= start_t + 1e-3), default=0.0)
+    seg_end = min((k for k in keyframes if k >= end_t - 1e-3), default=total_duration)
+    return seg_start, seg_end
+
+
+def split_head_tail(
+    ffmpeg_bin: str,
+    video_path: str,
+    out_dir: str,
+    start_t: float,
+    end_t: float,
+    total_duration: float,
+) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Stream-copies the video of [0, start_t) and [end_t, end) into MPEG-TS files,
+    in one pass with the segment muxer. start_t/end_t should be keyframes.
+    The muxer splits when the keyframe's packet arrives (decode order), so every
+    frame lands in exactly one part; an -ss/-to cut on copied input goes by DTS
+    and, with B-frames, leaves the keyframe and its followers in the head too.
+    Returns (head, tail), None for an empty part.
+    """
+    times = []
+    if start_t > 0:
+        times.append(start_t)
+    if end_t < total_duration:
+        times.append(end_t)
+    if not times:
+        return None, None
+
+    # A hair before each keyframe: its pts can round down a tick on the way in
+    cmd = [
+        ffmpeg_bin,
+        "-i",
+        video_path,
+        "-map",
+        "0:v:0",
+        "-c",
+        "copy",
+        "-f",
+        "segment",
+        "-segment_format",
+        "mpegts",
+        "-segment_times",
+        ",".join(_ffmpeg_time(max(t - 0.001, 0.0)) for t in times),
+        "-y",
+        os.path.join(out_dir, "part%d.ts"),
+    ]
+    run_ffmpeg(cmd)
+
+    parts = [os.path.join(out_dir, f"part{i}.ts") for i in range(len(times) + 1)]
+    head = parts[0] if start_t > 0 else None
+    tail = parts[-1] if end_t < total_duration else None
+    return head, tail
+
+
+def stitch_segments(
+    ffmpeg_bin: str,
+    video_path: str,
+    output_path: str,
+    start_t: float,
+    end_t: float,
+    total_duration: float,
+    overwrite: bool,
+    render_mid: Callable[[str], None],
+):
+    """
+    Re-encodes only the overlay window and stream-copies the rest.
+    1. head/tail: [0, start_t) and [end_t, end) copied as-is (split_head_tail).
+    2. mid.ts:    [start_t, end_t) written by render_mid(path), with the overlay,
+       on the source's timeline (-output_ts_offset start_t).
+    The concat demuxer joins the MPEG-TS parts without re-encoding, placing each
+    one at the sum of the durations before it: the parts' own timestamps (and
+    the muxer's shifts for B-frame delay) can't open a gap at a seam.
+    The audio is the source's, copied whole: no seams to drift across.
+    """
+    with tempfile.TemporaryDirectory(prefix="vba_") as tmp_dir:
+        mid_path = os.path.join(tmp_dir, "mid.ts")
+        head_path, tail_path = split_head_tail(
+            ffmpeg_bin, video_path, tmp_dir, start_t, end_t, total_duration
+        )
+
+        render_mid(mid_path)
+
+        # ffconcat list: file, then its duration (the tail's is whatever is left)
+        lines = ["ffconcat version 1.0"]
+        if head_path:
+            lines += [f"file {os.path.basename(head_path)}", f"duration {start_t}"]
+        lines += [f"file {os.path.basename(mid_path)}", f"duration {end_t - start_t}"]
+        if tail_path:
+            lines.append(f"file {os.path.basename(tail_path)}")
+        list_path = os.path.join(tmp_dir, "parts.ffconcat")
+        with open(list_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+
+        cmd_concat = [
+            ffmpeg_bin,
+            "-f",
+            "concat",
+            "-i",
+            list_path,
+            "-i",
+            video_path,
+            "-map",
+            "0:v",
+            "-map",
+            "1:a?",
+            "-c",
+            "copy",
+            *_FASTSTART,
+            "-y" if overwrite else "-n",
+            output_path,
+        ]
+        run_ffmpeg(cmd_concat)
+
+
+def render_segmented_ffmpeg(
+    ffmpeg_bin: str,
+    video_path: str,
+    overlay_png: bytes,
+    output_path: str,
+    start_t: float,
+    end_t: float,
+    total_duration: float,
+    overlay_filter: str,
+    video_input_args: List[str],
+    video_codec_args: List[str],
+    overwrite: bool,
+):
+    """stitch_segments() with the overlay window rendered by one FFmpeg call."""
+
+    def render_mid(mid_path: str):
+        cmd_mid = [
+            ffmpeg_bin,
+            *video_input_args,
+            "-ss",
+            _ffmpeg_time(start_t),
+            "-to",
+            _ffmpeg_time(end_t),
+            "-i",
+            video_path,
+            "-f",
+            "image2pipe",
+            "-i",
+            "pipe:0",
+            "-filter_complex",
+            overlay_filter,
+            "-an",  # stitch_segments() takes the audio from the source
+            *video_codec_args,
+            # On the source's timeline, like the stream-copied head and tail
+            "-output_ts_offset",
+            _ffmpeg_time(start_t),
+            "-y",
+            mid_path,
+        ]
+        run_ffmpeg(cmd_mid, overlay_png)
+
+    stitch_segments(
+        ffmpeg_bin,
+        video_path,
+        output_path,
+        start_t,
+        end_t,
+        total_duration,
+        overwrite,
+        render_mid,
+    )
+
+
+def _overlay_xy(position: str) -> str:
+    """Position name or "x,y" string -> FFmpeg overlay coordinates."""
+    if "," in position:
+        x, y = map(str.strip, position.split(",", 1))
+        return f"x={x}:y={y}"
+    return _POS_MAP.get(position, position)
+
+
+def _video_codec_args(
+    encoder_key: str,
+    quality: str,
+    preset: Optional[str],
+    threads: Optional[int],
+    crf: Optional[int] = None,
+) -> List[str]:
+    """Output-side video encoder arguments for a VIDEO_ENCODERS key."""
+    encoder, _, encoder_args, _ = VIDEO_ENCODERS[encoder_key]
+    args = ["-c:v", encoder, *encoder_args]
+    if encoder_key == "none":
+        x264_preset, x264_params = x264_settings(quality, preset, crf)
+        args += ["-preset", x264_preset, *x264_params]
+    if threads:
+        args += ["-threads", str(threads)]
+    return args
+
+
 def mode_ffmpeg_cli(
     video_path: str,
     image_path: str,
@@ -288,11 +1345,16 @@ def mode_ffmpeg_cli(
     scale: Optional[float],
     margin: float,
     overwrite: bool,
+    hw_encoder: str = "auto",
+    quality: str = "balanced",
+    preset: Optional[str] = None,
+    threads: Optional[int] = None,
+    image_bytes: Optional[bytes] = None,
+    crf: Optional[int] = None,
 ):
-    # 1. Get Video & Image Info
+    # 1. Get Video Info
     try:
-        v_info = get_media_info_ffmpeg(video_path)
-        i_info = get_media_info_ffmpeg(image_path)
+        v_info = probe_video(video_path)
     except Exception as e:
         logger.error(f"{e}")
         return
@@ -308,55 +1370,536 @@ def mode_ffmpeg_cli(
 
     if dur_t <= 0:
         logger.warning("Overlay out of bounds. Copying stream.")
-        subprocess.run([ffmpeg_bin, "-i", video_path, output_path])
+        copy_video_stream(video_path, output_path, overwrite)
         return
 
-    # 3. Calculate Scale
-    if scale is not None:
-        final_scale = scale
-    else:
-        final_scale = calculate_smart_scale(
+    # 3. Pre-Scale Overlay, kept in memory and piped to FFmpeg (no per-frame
+    # scale filter, no temp file). image_bytes skips reading image_path from disk.
+    try:
+        overlay_png, final_scale = get_scaled_overlay_png(
+            image_bytes or image_path,
             (int(v_info["width"]), int(v_info["height"])),
-            (int(i_info["width"]), int(i_info["height"])),
+            scale,
             margin,
         )
+    except Exception as e:
+        logger.error(f"{e}")
+        return
+    if scale is None:
         logger.info(f"FFmpeg Auto-Scale: {final_scale:.3f} (Margin {margin * 100}%)")
 
     # 4. Filter Construction
-    pos_map = {
-        "center": "x=(W-w)/2:y=(H-h)/2",
-        "top-left": "x=0:y=0",
-        "top-right": "x=W-w:y=0",
-        "bottom-left": "x=0:y=H-h",
-        "bottom-right": "x=W-w:y=H-h",
-    }
-    overlay_xy = pos_map.get(position, position)
+    overlay_xy = _overlay_xy(position)
+
+    # Segmented when a short overlay sits on a long H.264 video
+    segmented = v_info["codec"] == "h264" and dur_t < total_duration * 0.5
+    if segmented:
+        # Re-encoded window on keyframes; the overlay keeps its exact timing inside
+        seg_start, seg_end = snap_to_keyframes(
+            video_path, start_t, end_t, total_duration
+        )
+        window_timing = {
+            "start_ms": round((start_t - seg_start) * 1000),
+            "dur_ms": round(dur_t * 1000),
+        }
+        source_h264_args = _source_h264_args(video_path)
+
+    def render(encoder_key: str, gpu_overlay: bool = False):
+        encoder, input_args, _, filter_suffix = VIDEO_ENCODERS[encoder_key]
+        # A short segmented window gets a faster preset, unless one was chosen
+        x264_preset = preset
+        if segmented and quality == "balanced":
+            x264_preset = preset or _WINDOW_PRESET
+        video_codec_args = _video_codec_args(
+            encoder_key, quality, x264_preset, threads, crf
+        )
+        if segmented:
+            video_codec_args += source_h264_args
+        logger.info(f"Encoder: {encoder}" + (" (GPU overlay)" if gpu_overlay else ""))
+
+        filter_template = _TIMED_OVERLAY_FILTER
+        if gpu_overlay:
+            input_args = _CUDA_INPUT_ARGS
+            filter_template = _CUDA_OVERLAY_FILTER
+
+        # 5a. Segmented Render
+        # Only the overlay window is re-encoded, the rest is stream-copied.
+        if segmented:
+            logger.info(
+                "Running FFmpeg (segmented: re-encoding overlay window only)..."
+            )
+            overlay_filter = filter_template.format_map(
+                {"xy": overlay_xy, "suffix": filter_suffix, **window_timing}
+            )
+            render_segmented_ffmpeg(
+                ffmpeg_bin,
+                video_path,
+                overlay_png,
+                output_path,
+                seg_start,
+                seg_end,
+                total_duration,
+                overlay_filter,
+                input_args,
+                video_codec_args,
+                overwrite,
+            )
+            return
+
+        # 5b. Full Render
+        filter_complex = filter_template.format_map(
+            {
+                "xy": overlay_xy,
+                "start_ms": round(start_t * 1000),
+                "dur_ms": round(dur_t * 1000),
+                "suffix": filter_suffix,
+            }
+        )
 
-    filter_complex = (
-        f"[1:v]scale=iw*{final_scale}:-1[ovr];"
-        f"[0:v][ovr]overlay={overlay_xy}:enable='between(t,{start_t:.3f},{end_t:.3f})'"
+        cmd_ffmpeg = [
+            ffmpeg_bin,
+            *input_args,
+            "-i",
+            video_path,
+            "-f",
+            "image2pipe",
+            "-i",
+            "pipe:0",
+            "-filter_complex",
+            filter_complex,
+            "-c:a",
+            "copy",
+            *video_codec_args,
+            *_FASTSTART,
+            "-y" if overwrite else "-n",
+            output_path,
+        ]
+
+        logger.info("Running FFmpeg...")
+        run_ffmpeg(cmd_ffmpeg, overlay_png)
+
+    # 6. Encode. Attempts in order, each one the fallback of the previous:
+    #    NVENC + GPU overlay -> chosen encoder + CPU overlay -> libx264 ('auto' only)
+    # A segmented window is always libx264 with the source's profile, level and
+    # pixel format: its stream is stream-copied next to the source's own.
+    encoder_key = "none" if segmented else resolve_hw_encoder(hw_encoder)
+    if segmented and hw_encoder not in ("auto", "none"):
+        logger.info("Segmented render: overlay window encoded with libx264.")
+    attempts = []
+    if encoder_key == "nvenc" and "overlay_cuda" in get_available_filters():
+        attempts.append(("nvenc", True))
+    attempts.append((encoder_key, False))
+    if encoder_key != "none" and hw_encoder == "auto":
+        attempts.append(("none", False))
+
+    for i, (key, gpu_overlay) in enumerate(attempts):
+        try:
+            render(key, gpu_overlay)
+            return
+        except subprocess.CalledProcessError:
+            if i == len(attempts) - 1:
+                raise
+            logger.warning(f"{VIDEO_ENCODERS[key][0]} failed. Trying next option.")
+            if not gpu_overlay and key != "none":
+                _FAILED_ENCODERS.add(key)
+
+            # Remove the empty file a failed encoder init leaves behind
+            if os.path.exists(output_path) and os.path.getsize(output_path) == 0:
+                os.remove(output_path)
+
+
+def render_ffmpeg_group(
+    entries: List[Dict],
+    hw_encoder: str = "auto",
+    quality: str = "balanced",
+    preset: Optional[str] = None,
+    threads: Optional[int] = None,
+    crf: Optional[int] = None,
+):
+    """
+    Full renders of several videos in ONE FFmpeg process (N inputs, N outputs).
+    Saves the per-process start-up and codec init of N-1 separate runs.
+    Each entry: video, out, png (scaled overlay), xy, start_t, dur_t.
+    Identical overlays (same logo, same frame size) are passed in only once.
+    """
+    ffmpeg_bin = get_binary_path("ffmpeg")
+    encoder_key = resolve_hw_encoder(hw_encoder)
+    _, input_args, _, filter_suffix = VIDEO_ENCODERS[encoder_key]
+    video_codec_args = _video_codec_args(encoder_key, quality, preset, threads, crf)
+    logger.info(
+        f"Running FFmpeg (grouped: {len(entries)} videos, "
+        f"encoder {VIDEO_ENCODERS[encoder_key][0]})..."
     )
 
-    cmd_ffmpeg = [
-        ffmpeg_bin,
-        "-i",
-        video_path,
-        "-i",
-        image_path,
-        "-filter_complex",
-        filter_complex,
-        "-c:a",
-        "copy",
-        "-c:v",
-        "libx264",
-        "-preset",
-        "fast",
-        "-y" if overwrite else "-n",
-        output_path,
-    ]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        # Inputs: videos first (0..N-1), then one PNG per distinct overlay
+        png_inputs: Dict[bytes, int] = {}
+        for entry in entries:
+            png_inputs.setdefault(entry["png"], len(entries) + len(png_inputs))
+
+        cmd = [ffmpeg_bin, "-y"]
+        for entry in entries:
+            cmd += [*input_args, "-i", entry["video"]]
+        for png, index in png_inputs.items():
+            png_path = os.path.join(tmp_dir, f"overlay{index}.png")
+            with open(png_path, "wb") as f:
+                f.write(png)
+            cmd += ["-i", png_path]
+
+        filters = []
+        outputs = []
+        for i, entry in enumerate(entries):
+            overlay_filter = _TIMED_OVERLAY_FILTER.format_map(
+                {
+                    "xy": entry["xy"],
+                    "start_ms": round(entry["start_t"] * 1000),
+                    "dur_ms": round(entry["dur_t"] * 1000),
+                    "suffix": filter_suffix,
+                }
+            )
+            # Re-label the single-video template for input i / output i
+            overlay_filter = (
+                overlay_filter.replace("[1:v]", f"[{png_inputs[entry['png']]}:v]")
+                .replace("[0:v]", f"[{i}:v]")
+                .replace("[ovr]", f"[ovr{i}]")
+            )
+            filters.append(f"{overlay_filter}[out{i}]")
+            outputs += [
+                "-map",
+                f"[out{i}]",
+                "-map",
+                f"{i}:a?",
+                "-c:a",
+                "copy",
+                *video_codec_args,
+                *_FASTSTART,
+                entry["out"],
+            ]
+
+        cmd += ["-filter_complex", ";".join(filters), *outputs]
+        run_ffmpeg(cmd)
+
+
+# The blends below are 8-bit fixed point: fade and alpha are 0-255 integers and
+# (t + (t >> 8)) >> 8 divides by 255 with rounding, so everything fits in uint16.
+def _blend_numpy(frame, ox, oy, overlay_rgb, overlay_alpha, fade):
+    """Alpha-blends overlay_rgb onto frame at (ox, oy), in place. NumPy version."""
+    h, w = overlay_alpha.shape
+    region = frame[oy : oy + h, ox : ox + w]
+    alpha = overlay_alpha[..., None].astype("uint16")
+    if fade < 255:
+        alpha = (alpha * fade + 127) // 255
+    t = overlay_rgb * alpha + region * (255 - alpha) + 128
+    region[:] = (t + (t >> 8)) >> 8
+
+
+if numba is not None:
+
+    @numba.njit(parallel=True, fastmath=True, cache=True)
+    def _blend(frame, ox, oy, overlay_rgb, overlay_alpha, fade):
+        """Same as _blend_numpy, compiled: no temporary arrays, rows in parallel."""
+        for y in numba.prange(overlay_alpha.shape[0]):
+            for x in range(overlay_alpha.shape[1]):
+                a = (overlay_alpha[y, x] * fade + 127) // 255
+                px = frame[oy + y, ox + x]
+                for c in range(3):
+                    t = overlay_rgb[y, x, c] * a + px[c] * (255 - a) + 128
+                    px[c] = (t + (t >> 8)) >> 8
+
+else:
+    _blend = _blend_numpy
+
+
+def _overlay_origin(
+    position: Union[str, Tuple[float, float]],
+    frame_size: Tuple[int, int],
+    overlay_size: Tuple[int, int],
+) -> Tuple[int, int]:
+    """Top-left pixel of the overlay for a named position or (x, y) tuple."""
+    if isinstance(position, tuple):
+        return int(position[0]), int(position[1])
+
+    free_w = frame_size[0] - overlay_size[0]
+    free_h = frame_size[1] - overlay_size[1]
+    return {
+        "top-left": (0, 0),
+        "top-right": (free_w, 0),
+        "bottom-left": (0, free_h),
+        "bottom-right": (free_w, free_h),
+    }.get(position, (free_w // 2, free_h // 2))
+
+
+def _pyav_nvenc_usable(av, width: int, height: int) -> bool:
+    """Opens (then drops) an h264_nvenc encoder: False without a usable NVIDIA GPU."""
+    if "h264_nvenc" not in av.codecs_available or "nvenc" in _FAILED_ENCODERS:
+        return False
+    try:
+        ctx = av.CodecContext.create("h264_nvenc", "w")
+        ctx.width, ctx.height, ctx.pix_fmt = width, height, "yuv420p"
+        ctx.time_base = Fraction(1, 90000)
+        ctx.open()
+        return True
+    except av.FFmpegError:
+        _FAILED_ENCODERS.add("nvenc")
+        return False
+
+
+def _open_pyav_source(av, path: str, gpu: bool):
+    """Opens path for decoding, on NVDEC (frames downloaded to RAM) if gpu."""
+    if gpu:
+        try:
+            from av.codec.hwaccel import HWAccel  # PyAV 14+
+
+            return av.open(path, hwaccel=HWAccel("cuda"))
+        except (ImportError, av.FFmpegError):
+            logger.warning("NVDEC not available. Decoding on the CPU.")
+    return av.open(path)
+
+
+def mode_pyav(
+    video_path: str,
+    image_path: str,
+    output_path: str,
+    start_pct: float,
+    duration_sec: float,
+    position: Union[str, Tuple[float, float]],
+    scale: Optional[float],
+    margin: float,
+    fade_in: float,
+    fade_out: float,
+    threads: Optional[int],
+    quality: str = "balanced",
+    preset: Optional[str] = None,
+    image_bytes: Optional[bytes] = None,
+    crf: Optional[int] = None,
+    hw_encoder: str = "none",
+):
+    """
+    Streams frames through one PyAV decoder/encoder pair.
+    Only frames inside the overlay window are converted and blended in NumPy,
+    the rest go straight back to the encoder. Audio packets are copied.
+    hw_encoder 'auto'/'nvenc' decodes on NVDEC and encodes on NVENC when an
+    NVIDIA GPU is usable (libx264 otherwise).
+    """
+    try:
+        import av
+        import numpy as np  # Installed with MoviePy
+    except ImportError:
+        logger.warning("PyAV not installed (pip install av). Using MoviePy engine.")
+        mode_moviepy(
+            video_path,
+            image_path,
+            output_path,
+            start_pct,
+            duration_sec,
+            position,
+            scale,
+            margin,
+            fade_in,
+            fade_out,
+            threads,
+            quality,
+            preset,
+            image_bytes,
+            crf,
+        )
+        return
 
-    logger.info("Running FFmpeg...")
-    subprocess.run(cmd_ffmpeg, check=True)
+    # 1. Probe & Timing
+    v_info = probe_video(video_path)
+    start_t, dur_t = get_overlay_timing(v_info["duration"], start_pct, duration_sec)
+    end_t = start_t + dur_t
+
+    if dur_t <= 0:
+        logger.warning("Overlay out of bounds. Copying stream.")
+        copy_video_stream(video_path, output_path, overwrite=True)
+        return
+
+    logger.info(f"Overlay Timing: Start={start_t:.2f}s | Duration={dur_t:.2f}s")
+
+    # 2. Overlay: scaled once, split into uint8 RGB and alpha planes
+    frame_w, frame_h = int(v_info["width"]), int(v_info["height"])
+    overlay = load_overlay_image(image_bytes or image_path)
+    if scale is None:
+        scale = calculate_smart_scale((frame_w, frame_h), overlay.size, margin)
+        logger.info(f"Auto-calculated scale: {scale:.3f}")
+    overlay = resize_overlay(overlay, scale)
+
+    # Clip the overlay to the frame (coordinates may push it partly outside)
+    x, y = _overlay_origin(position, (frame_w, frame_h), overlay.size)
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + overlay.width, frame_w), min(y + overlay.height, frame_h)
+    if x0 >= x1 or y0 >= y1:
+        logger.warning("Overlay is outside the frame. Copying stream.")
+        copy_video_stream(video_path, output_path, overwrite=True)
+        return
+
+    rgba = np.asarray(overlay)[y0 - y : y1 - y, x0 - x : x1 - x]
+    ovr_rgb = np.ascontiguousarray(rgba[..., :3])
+    ovr_alpha = np.ascontiguousarray(rgba[..., 3])
+
+    # 3. Encoder settings: NVENC (same options as the FFmpeg engine) or libx264
+    gpu = hw_encoder in ("auto", "nvenc") and _pyav_nvenc_usable(av, frame_w, frame_h)
+    if gpu:
+        encoder, _, nvenc_args, _ = VIDEO_ENCODERS["nvenc"]
+        encoder_options = {
+            flag.lstrip("-"): value
+            for flag, value in zip(nvenc_args[::2], nvenc_args[1::2])
+        }
+    else:
+        if hw_encoder == "nvenc":
+            logger.warning("NVENC not available. Using libx264.")
+        encoder = "libx264"
+        x264_preset, x264_params = x264_settings(quality, preset, crf)
+        encoder_options = {"preset": x264_preset}
+        if "-crf" in x264_params:
+            encoder_options["crf"] = x264_params[x264_params.index("-crf") + 1]
+
+    logger.info(f"Rendering (PyAV, {encoder}) -> {output_path}")
+    with (
+        _open_pyav_source(av, video_path, gpu) as src,
+        av.open(output_path, "w", options={"movflags": "faststart"}) as dst,
+    ):
+        in_video = src.streams.video[0]
+        in_video.thread_type = "AUTO"
+
+        out_video = dst.add_stream(encoder, rate=in_video.average_rate)
+        out_video.width, out_video.height = frame_w, frame_h
+        out_video.pix_fmt = "yuv420p"
+        out_video.time_base = in_video.time_base
+        out_video.options = encoder_options
+        if threads and not gpu:
+            out_video.codec_context.thread_count = threads
+
+        in_audio = src.streams.audio[0] if src.streams.audio else None
+        out_audio = dst.add_stream_from_template(in_audio) if in_audio else None
+
+        streams = [in_video] + ([in_audio] if in_audio else [])
+        for packet in src.demux(streams):
+            if packet.stream is in_audio:
+                if packet.dts is None:
+                    continue  # Flush packet, nothing to mux
+                packet.stream = out_audio
+                dst.mux(packet)
+                continue
+
+            for frame in packet.decode():
+                t = frame.time
+                if start_t <= t < end_t:
+                    # Fades scale the alpha plane (255 when no fade is set)
+                    fade = 1.0
+                    if fade_in > 0:
+                        fade = min(fade, (t - start_t) / fade_in)
+                    if fade_out > 0:
+                        fade = min(fade, (end_t - t) / fade_out)
+                    fade = round(max(fade, 0.0) * 255)
+                    img = frame.to_ndarray(format="rgb24")
+                    _blend(img, x0, y0, ovr_rgb, ovr_alpha, fade)
+
+                    blended = av.VideoFrame.from_ndarray(img, format="rgb24")
+                    blended.pts, blended.time_base = frame.pts, frame.time_base
+                    frame = blended
+
+                dst.mux(out_video.encode(frame))
+
+        dst.mux(out_video.encode(None))
+
+
+def _hash_file_sample(h, path: str):
+    """Feeds size + first/last 1 MB of a file into h (cheap content ID)."""
+    size = os.path.getsize(path)
+    h.update(str(size).encode())
+    with open(path, "rb") as f:
+        h.update(f.read(_CACHE_SAMPLE))
+        if size > _CACHE_SAMPLE:
+            f.seek(max(size - _CACHE_SAMPLE, _CACHE_SAMPLE))
+            h.update(f.read())
+
+
+def _cache_settings(
+    position: str,
+    scale: Optional[float],
+    margin: float,
+    final_pct: float,
+    duration_sec: float,
+    fade_in: float,
+    fade_out: float,
+    mode: str,
+    hw_encoder: str,
+    quality: str,
+    preset: Optional[str],
+    crf: Optional[int],
+) -> Tuple:
+    """Every setting that changes the output, for _cache_key()."""
+    return (
+        position,
+        scale,
+        margin,
+        final_pct,
+        duration_sec,
+        fade_in,
+        fade_out,
+        mode,
+        hw_encoder,
+        quality,
+        preset,
+        crf,
+    )
+
+
+def _cache_key(video: str, image: Union[str, bytes], settings: Tuple) -> str:
+    """Content hash of the inputs plus every setting that changes the output."""
+    h = hashlib.blake2b(digest_size=16)
+    _hash_file_sample(h, video)
+    if isinstance(image, bytes):
+        # Same sample as _hash_file_sample(): path or bytes, one cache key
+        h.update(str(len(image)).encode())
+        h.update(image[:_CACHE_SAMPLE])
+        h.update(image[max(len(image) - _CACHE_SAMPLE, _CACHE_SAMPLE) :])
+    else:
+        _hash_file_sample(h, image)
+    h.update(repr(settings).encode())
+    return h.hexdigest() + ".mp4"
+
+
+def _cache_path(video: str, image: Union[str, bytes], settings: Tuple) -> str:
+    return os.path.join(CACHE_DIR, _cache_key(video, image, settings))
+
+
+def _store_in_cache(out: str, cache_path: str):
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    shutil.copyfile(out, tmp_path)
+    os.replace(tmp_path, cache_path)  # Atomic, parallel jobs may race
+    _prune_cache()
+
+
+def _prune_cache():
+    """
+    Drops cache entries unused for CACHE_MAX_AGE, then the least recently used
+    ones until the cache fits in CACHE_MAX_BYTES (a hit refreshes the mtime).
+    """
+    cutoff = time.time() - CACHE_MAX_AGE
+    entries = []
+    with os.scandir(CACHE_DIR) as it:
+        for entry in it:
+            try:
+                st = entry.stat()
+            except FileNotFoundError:  # Pruned by a parallel job
+                continue
+            if entry.name.endswith(".tmp") and st.st_mtime >= cutoff:
+                continue  # Being written by a parallel job
+            entries.append((st.st_mtime, st.st_size, entry.path))
+    entries.sort(reverse=True)  # Newest first
+
+    total = 0
+    for mtime, size, path in entries:
+        total += size
+        if mtime < cutoff or total > CACHE_MAX_BYTES:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
 
 
 def process_single_video(
@@ -372,10 +1915,18 @@ def process_single_video(
     fade_out: float,
     mode: str,
     overwrite: bool,
-    threads: int,
+    threads: Optional[int],
+    hw_encoder: str = "auto",
+    quality: str = "balanced",
+    auto_threads: bool = False,
+    image_bytes: Optional[bytes] = None,
+    use_cache: bool = False,
+    encode_preset: Optional[str] = None,
+    crf: Optional[int] = None,
 ):
     """
     Orchestrator for a single video. Handles checks, normalization, and dispatching.
+    With use_cache, an identical earlier render (same inputs + settings) is copied.
     """
     if not overwrite and os.path.exists(out):
         logger.warning(f"File '{out}' exists. Skipping. Use --overwrite to force.")
@@ -392,22 +1943,55 @@ def process_single_video(
 
     logger.info(f"Processing: {os.path.basename(video)}")
 
-    if mode == "moviepy":
-        # Coordinate Parsing
-        pos_arg = position
-        if "," in position:
-            try:
-                x, y = map(str.strip, position.split(","))
-                x = float(x) if x.replace(".", "", 1).isdigit() else None
-                y = float(y) if y.replace(".", "", 1).isdigit() else None
-                if x is not None and y is not None:
-                    pos_arg = (x, y)
-                else:
-                    raise ValueError
-            except ValueError:
-                pos_arg = (0.0, 0.0)
+    # Threads/Preset: lookup by core count and resolution (threads=None lets FFmpeg pick)
+    # An explicit --encode-preset wins over the looked-up one.
+    preset = encode_preset
+    if auto_threads:
+        v_info = probe_video(video)
+        threads, auto_preset = pick_threads_and_preset(
+            v_info["width"], v_info["height"]
+        )
+        preset = preset or auto_preset
+        logger.info(f"Auto-Threads: {threads} threads, preset '{preset}'")
 
-        mode_moviepy(
+    # Output cache: skip the render entirely for a repeated job
+    cache_path = None
+    if use_cache:
+        settings = _cache_settings(
+            position,
+            scale,
+            margin,
+            final_pct,
+            duration_sec,
+            fade_in,
+            fade_out,
+            mode,
+            hw_encoder,
+            quality,
+            preset,  # The one actually used (--auto-threads may pick it)
+            crf,
+        )
+        cache_path = _cache_path(video, image_bytes or image, settings)
+        if os.path.exists(cache_path):
+            logger.info("Cache hit. Copying previous output.")
+            shutil.copyfile(cache_path, out)
+            os.utime(cache_path)  # Recently used: pruned last
+            return
+    render_start = time.time()
+
+    if mode in ("moviepy", "pyav"):
+        # Coordinate Parsing: "x,y" -> (x, y); negatives place it partly off-screen
+        pos_arg = position
+        match = _POS_RE.match(position)
+        if match:
+            pos_arg = (float(match[1]), float(match[2]))
+        elif "," in position:
+            pos_arg = (0.0, 0.0)
+
+        # PyAV can also decode/encode on the GPU (NVDEC/NVENC)
+        gpu_args = {"hw_encoder": hw_encoder} if mode == "pyav" else {}
+        render = mode_pyav if mode == "pyav" else mode_moviepy
+        render(
             video,
             image,
             out,
@@ -419,6 +2003,11 @@ def process_single_video(
             fade_in,
             fade_out,
             threads,
+            quality,
+            preset,
+            image_bytes,
+            crf,
+            **gpu_args,
         )
 
     elif mode == "ffmpeg":
@@ -432,14 +2021,312 @@ def process_single_video(
             scale,
             margin,
             overwrite,
+            hw_encoder,
+            quality,
+            preset,
+            threads,
+            image_bytes,
+            crf,
         )
 
+    # Store fresh outputs only (a failed render may leave an older file behind)
+    if cache_path and os.path.exists(out) and os.path.getmtime(out) >= render_start:
+        _store_in_cache(out, cache_path)
+
 
 # ---------------------------------------------------------------------------
 # CLI & BATCH ORCHESTRATION
 # ---------------------------------------------------------------------------
 
 
+def list_files(folder: str, extensions: frozenset) -> List[str]:
+    """Files directly inside folder with one of these extensions, by name."""
+    with os.scandir(folder) as entries:
+        return sorted(
+            entry.path
+            for entry in entries
+            if os.path.splitext(entry.name)[1].lower() in extensions and entry.is_file()
+        )
+
+
+def list_videos(folder: str) -> List[str]:
+    return list_files(folder, _VIDEO_EXTS)
+
+
+def list_images(folder: str) -> List[str]:
+    return list_files(folder, _IMG_EXTS)
+
+
+def _run_job(job: Dict) -> float:
+    """
+    Worker for run_jobs(). Top-level so it pickles into the process pool.
+    Returns the video duration for the summary metrics.
+    """
+    process_single_video(**job)
+    return float(probe_video(job["video"])["duration"])
+
+
+def resolve_workers(jobs: str, threads_per_job: int, job_count: int) -> int:
+    """'auto' -> one worker per threads_per_job cores, capped at the job count."""
+    if jobs != "auto":
+        return max(1, int(jobs))
+    cores = os.process_cpu_count() or 4
+    return max(1, min(job_count, cores // threads_per_job))
+
+
+def run_jobs(jobs: List[Dict], workers: int) -> Tuple[int, float]:
+    """
+    Renders independent process_single_video() jobs, 'workers' at a time.
+    Many FFmpeg processes with few threads each scale better than one
+    process with many threads (x264 gains little past a handful of threads).
+    Returns (videos processed, seconds of video processed).
+    """
+    processed = 0
+    content_seconds = 0.0
+
+    # One worker: stay in this process (no pool start-up, plain tracebacks)
+    if workers <= 1:
+        for job in jobs:
+            try:
+                content_seconds += _run_job(job)
+                processed += 1
+            except Exception as e:
+                logger.error(f"Failed to process {os.path.basename(job['video'])}: {e}")
+        return processed, content_seconds
+
+    # 'spawn' on every OS: forked workers would inherit the parent's threads/pipes
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+        futures = {executor.submit(_run_job, job): job for job in jobs}
+        for future in as_completed(futures):
+            name = os.path.basename(futures[future]["video"])
+            try:
+                content_seconds += future.result()
+                processed += 1
+            except Exception as e:
+                logger.error(f"Failed to process {name}: {e}")
+
+    return processed, content_seconds
+
+
+def run_manifest(
+    manifest_path: str, defaults: Dict, jobs: str = "auto", threads_per_job: int = 2
+) -> Tuple[int, float]:
+    """
+    Renders every job of a JSONL manifest in parallel.
+    Each job gets threads_per_job threads, unless --threads (defaults["threads"])
+    or the job's own line sets them.
+    Returns (videos processed, seconds of video processed).
+    """
+    threads_per_job = defaults.get("threads") or threads_per_job
+    with open(manifest_path, encoding="utf-8") as f:
+        manifest_jobs = [
+            {**defaults, "threads": threads_per_job, **json.loads(line)}
+            for line in f
+            if line.strip()
+        ]
+
+    workers = resolve_workers(jobs, threads_per_job, len(manifest_jobs))
+    logger.info(f"Manifest: {len(manifest_jobs)} jobs on {workers} workers.")
+    return run_jobs(manifest_jobs, workers)
+
+
+def run_grouped_ffmpeg(
+    jobs: List[Dict], group_size: int
+) -> Tuple[int, float, List[Dict]]:
+    """
+    Renders the FFmpeg-engine jobs that need a plain full render in groups of
+    group_size, one FFmpeg process per group (see render_ffmpeg_group()).
+    Jobs share the encoder settings of the first job, as main()'s jobs do.
+    Everything else (segmented renders, skips, cache hits, failed groups) is
+    returned for the normal one-process-per-video path.
+    Returns (videos processed, seconds of video processed, remaining jobs).
+    """
+    entries = []
+    remaining = []
+    for job in jobs:
+        entry = _plan_group_entry(job)
+        if entry:
+            entries.append(entry)
+        else:
+            remaining.append(job)
+
+    processed = 0
+    content_seconds = 0.0
+    for i in range(0, len(entries), group_size):
+        group = entries[i : i + group_size]
+        if len(group) == 1:
+            remaining.append(group[0]["job"])
+            continue
+
+        for entry in group:
+            logger.info(f"Processing: {os.path.basename(entry['video'])} (grouped)")
+        first = group[0]["job"]
+        try:
+            render_ffmpeg_group(
+                group,
+                first["hw_encoder"],
+                first["quality"],
+                first["encode_preset"],
+                first["threads"],
+                first["crf"],
+            )
+        except subprocess.CalledProcessError:
+            logger.warning("Grouped render failed. Rendering those videos one by one.")
+            remaining += [entry["job"] for entry in group]
+            continue
+
+        for entry in group:
+            if entry["cache_path"]:
+                _store_in_cache(entry["job"]["out"], entry["cache_path"])
+            processed += 1
+            content_seconds += entry["total_duration"]
+
+    return processed, content_seconds, remaining
+
+
+def _plan_group_entry(job: Dict) -> Optional[Dict]:
+    """render_ffmpeg_group() entry for a job, or None if it needs the normal path."""
+    if job["mode"] != "ffmpeg" or job["auto_threads"]:
+        return None
+    if not job["overwrite"] and os.path.exists(job["out"]):
+        return None
+
+    final_pct = job["start_percent"]
+    if final_pct > 1.0:
+        final_pct /= 100.0
+    if not (0.0 <= final_pct <= 1.0):
+        return None
+
+    try:
+        v_info = probe_video(job["video"])
+    except Exception:
+        return None
+    total_duration = v_info["duration"]
+    start_t, dur_t = get_overlay_timing(total_duration, final_pct, job["duration_sec"])
+    # Skips and segmented renders (see mode_ffmpeg_cli) stay on the normal path
+    if dur_t <= 0 or (v_info["codec"] == "h264" and dur_t < total_duration * 0.5):
+        return None
+
+    image = job.get("image_bytes") or job["image"]
+    cache_path = None
+    if job["use_cache"]:
+        # Same key as process_single_video()
+        settings = _cache_settings(
+            job["position"],
+            job["scale"],
+            job["margin"],
+            final_pct,
+            job["duration_sec"],
+            job["fade_in"],
+            job["fade_out"],
+            job["mode"],
+            job["hw_encoder"],
+            job["quality"],
+            job["encode_preset"],  # No --auto-threads here (see above)
+            job["crf"],
+        )
+        cache_path = _cache_path(job["video"], image, settings)
+        if os.path.exists(cache_path):
+            return None
+
+    try:
+        png, _ = get_scaled_overlay_png(
+            image,
+            (int(v_info["width"]), int(v_info["height"])),
+            job["scale"],
+            job["margin"],
+        )
+    except Exception:
+        return None
+
+    return {
+        "job": job,
+        "video": job["video"],
+        "out": job["out"],
+        "png": png,
+        "xy": _overlay_xy(job["position"]),
+        "start_t": start_t,
+        "dur_t": dur_t,
+        "total_duration": total_duration,
+        "cache_path": cache_path,
+    }
+
+
+def parse_cpu_set(cpu_set: str) -> List[int]:
+    """
+    Parses a taskset-style CPU list ("0-5,8") into CPU indices.
+    Raises ValueError for anything else, or for CPUs this machine doesn't have.
+    """
+    cpu_count = os.cpu_count() or 1
+    cpus = []
+    for part in cpu_set.split(","):
+        first, _, last = part.strip().partition("-")
+        if not first.isdigit() or not (last or first).isdigit():
+            raise ValueError(f"'{part.strip()}' is not a CPU number or range.")
+        first, last = int(first), int(last or first)
+        if first > last:
+            raise ValueError(f"range {first}-{last} is backwards.")
+        if last >= cpu_count:
+            raise ValueError(f"no CPU {last} (CPUs are 0-{cpu_count - 1}).")
+        cpus.extend(range(first, last + 1))
+    return cpus
+
+
+def limit_cpu_usage(cpus: Optional[List[int]], nice: bool):
+    """
+    Pins this process to cpus (see parse_cpu_set) and/or lowers its priority.
+    FFmpeg children and pool workers inherit both, leaving the other cores free.
+    """
+    # Linux has both natively; Windows/macOS need psutil (optional)
+    if cpus and hasattr(os, "sched_setaffinity"):
+        os.sched_setaffinity(0, cpus)
+        cpus = None
+    if nice and hasattr(os, "nice"):
+        os.nice(10)
+        nice = False
+
+    if cpus or nice:
+        try:
+            import psutil
+        except ImportError:
+            logger.warning("--cpu-set/--nice need psutil here (pip install psutil).")
+            return
+
+        proc = psutil.Process()
+        if cpus:
+            try:
+                proc.cpu_affinity(cpus)
+            except AttributeError:  # macOS has no affinity API
+                logger.warning("CPU affinity is not supported on this platform.")
+        if nice:
+            proc.nice(getattr(psutil, "BELOW_NORMAL_PRIORITY_CLASS", 10))
+
+
+def format_hms(seconds: float) -> str:
+    """Seconds -> "HH:MM:SS" (hours keep counting past a day)."""
+    hours, rest = divmod(int(seconds), 3600)
+    minutes, seconds = divmod(rest, 60)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}"
+
+
+def print_summary(
+    videos_processed: int, video_seconds: float, execution_seconds: float
+):
+    """Prints the final metrics block."""
+    # Format times to HH:MM:SS
+    exec_time_str = format_hms(execution_seconds)
+    video_time_str = format_hms(video_seconds)
+
+    print("-" * 40)
+    print("PROCESSING SUMMARY")
+    print("-" * 40)
+    print(f"Total Videos Processed: {videos_processed}")
+    print(f"Total Video Content:    {video_time_str} (HH:MM:SS)")
+    print(f"Total Execution Time:   {exec_time_str} (HH:MM:SS)")
+    print("-" * 40)
+
+
 @click.command()
 @click.option(
     "--video", required=False, help="Input video file OR Directory of videos."
@@ -465,12 +2352,86 @@ def process_single_video(
 @click.option("--fade-out", default=0.0, help="Fade-out seconds.")
 @click.option(
     "--mode",
-    type=click.Choice(["moviepy", "ffmpeg"]),
-    default="moviepy",
-    help="Rendering engine.",
+    type=click.Choice(["moviepy", "ffmpeg", "pyav"]),
+    default="ffmpeg",
+    help="Rendering engine. MoviePy is only needed for fades; PyAV also does fades, faster.",
 )
 @click.option("--overwrite", is_flag=True, help="Overwrite existing files.")
-@click.option("--threads", default=4, help="CPU threads.")
+@click.option(
+    "--threads", default=None, type=int, help="CPU threads (default: FFmpeg decides)."
+)
+@click.option(
+    "--hw-encoder",
+    "--hwaccel",
+    "hw_encoder",
+    type=click.Choice(["none", "nvenc", "qsv", "videotoolbox", "vaapi", "auto"]),
+    default="auto",
+    help="H.264 encoder (FFmpeg engine; PyAV engine: nvenc). 'none' forces libx264.",
+)
+@click.option(
+    "--quality",
+    type=click.Choice(["draft", "balanced", "archive"]),
+    default="balanced",
+    help="libx264 speed/quality trade-off. 'draft' is ~2x faster.",
+)
+@click.option(
+    "--encode-preset",
+    type=click.Choice(
+        [
+            "ultrafast",
+            "superfast",
+            "veryfast",
+            "faster",
+            "fast",
+            "medium",
+            "slow",
+            "slower",
+            "veryslow",
+        ]
+    ),
+    default=None,
+    help="libx264 preset (default: from --quality).",
+)
+@click.option(
+    "--crf",
+    default=None,
+    type=click.IntRange(0, 51),
+    help="libx264 CRF, lower is better (default: from --quality).",
+)
+@click.option(
+    "--auto-threads",
+    is_flag=True,
+    help="Pick threads and preset from core count and resolution.",
+)
+@click.option(
+    "--manifest",
+    default=None,
+    help="JSONL file, one job per line (video, image, out + optional overrides).",
+)
+@click.option(
+    "--cpu-set",
+    default=None,
+    help='Only use these CPUs, e.g. "0-5" (keeps other cores free).',
+)
+@click.option("--nice", is_flag=True, help="Run at lower CPU priority.")
+@click.option(
+    "--jobs",
+    default="auto",
+    help="Videos rendered in parallel ('auto': one per 2 cores or per --threads).",
+)
+@click.option(
+    "--group",
+    "group_size",
+    default=1,
+    type=click.IntRange(1, 8),
+    help="FFmpeg engine: render up to N videos per FFmpeg process (saves start-up).",
+)
+@click.option(
+    "--no-cache",
+    is_flag=True,
+    help=f"Always re-render (outputs are otherwise cached in {CACHE_DIR}, "
+    f"up to {CACHE_MAX_BYTES // 1024**3} GB, {CACHE_MAX_AGE // 86400:.0f} days unused).",
+)
 def main(
     video,
     image,
@@ -485,25 +2446,87 @@ def main(
     mode,
     overwrite,
     threads,
+    hw_encoder,
+    quality,
+    encode_preset,
+    crf,
+    auto_threads,
+    manifest,
+    cpu_set,
+    nice,
+    no_cache,
+    jobs,
+    group_size,
 ):
     """
     Main Entry Point.
     """
+    if jobs != "auto" and not jobs.isdigit():
+        raise click.BadParameter("must be 'auto' or a number.", param_hint="--jobs")
+
+    cpus = None
+    if cpu_set:
+        try:
+            cpus = parse_cpu_set(cpu_set)
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--cpu-set")
+
+    # Applied to this process first, so every FFmpeg/worker child inherits it
+    if cpus or nice:
+        limit_cpu_usage(cpus, nice)
+
+    # FFmpeg engine ignores fades. Fall back to MoviePy unless the user chose an engine.
+    mode_source = click.get_current_context().get_parameter_source("mode")
+    fades_requested = fade_in > 0 or fade_out > 0
+    if fades_requested and mode_source == click.core.ParameterSource.DEFAULT:
+        logger.info("Fades requested. Switching to MoviePy engine.")
+        mode = "moviepy"
+
     # METRICS START
     process_start_time = time.time()
     total_video_duration_processed = 0.0
     videos_processed_count = 0
 
+    # Shared by every job (manifest lines may override any of them)
+    defaults = {
+        "position": position,
+        "scale": scale,
+        "margin": margin,
+        "start_percent": start_percent,
+        "duration_sec": duration_sec,
+        "fade_in": fade_in,
+        "fade_out": fade_out,
+        "mode": mode,
+        "overwrite": overwrite,
+        "threads": threads,
+        "hw_encoder": hw_encoder,
+        "quality": quality,
+        "encode_preset": encode_preset,
+        "crf": crf,
+        "auto_threads": auto_threads,
+        "use_cache": not no_cache,
+    }
+
+    # 0. MANIFEST MODE (independent jobs rendered in parallel)
+    if manifest:
+        videos_processed_count, total_video_duration_processed = run_manifest(
+            manifest, defaults, jobs
+        )
+        print_summary(
+            videos_processed_count,
+            total_video_duration_processed,
+            time.time() - process_start_time,
+        )
+        return
+
     # Helper to calculate video length before processing (for logging)
     def get_vid_duration(path):
         try:
-            # Quick probe using MoviePy context just to read header
-            with VideoFileClip(path) as v:
-                return v.duration
-        except (OSError, IOError, ValueError):
+            # Header-only probe, cached, so the render reuses it
+            return float(probe_video(path)["duration"])
+        except (OSError, RuntimeError):
             # OSError: file not found or permission denied
-            # IOError: I/O related errors
-            # ValueError: invalid video format
+            # RuntimeError: ffprobe missing or could not read the file
             logger.debug(f"Could not read duration from {path}")
             return 0.0
 
@@ -516,8 +2539,8 @@ def main(
         video_dir = video
 
         image_path = image
-        if not image_path:
-            imgs = glob.glob(os.path.join("images", "*"))
+        if not image_path and os.path.isdir("images"):
+            imgs = list_images("images")
             if imgs:
                 image_path = imgs[0]
 
@@ -529,12 +2552,10 @@ def main(
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
 
-        vid_exts = ["*.mp4", "*.mov", "*.mkv", "*.avi", "*.webm"]
-        for ext in vid_exts:
-            for v in glob.glob(os.path.join(video_dir, ext)):
-                name = os.path.splitext(os.path.basename(v))[0]
-                o = os.path.join(output_dir, f"{name}_branded.mp4")
-                tasks.append((v, image_path, o))
+        for v in list_videos(video_dir):
+            name = os.path.splitext(os.path.basename(v))[0]
+            o = os.path.join(output_dir, f"{name}_branded.mp4")
+            tasks.append((v, image_path, o))
 
     # 2. SINGLE FILE
     elif video and os.path.isfile(video) and image:
@@ -558,21 +2579,14 @@ def main(
             return
 
         # Find Image
-        img_files = glob.glob(os.path.join(image_dir, "*"))
-        img_files = [
-            f
-            for f in img_files
-            if f.lower().endswith((".png", ".jpg", ".jpeg", ".webp"))
-        ]
+        img_files = list_images(image_dir)
         if not img_files:
             logger.error("No images found.")
             return
         selected_image = img_files[0]
 
         # Find Videos
-        vid_files = []
-        for ext in ["*.mp4", "*.mov", "*.mkv", "*.avi"]:
-            vid_files.extend(glob.glob(os.path.join(video_dir, ext)))
+        vid_files = list_videos(video_dir)
 
         if not os.path.exists(output_dir):
             os.makedirs(output_dir)
@@ -587,48 +2601,39 @@ def main(
         logger.warning("No videos found to process.")
         return
 
-    logger.info(f"Starting queue: {len(tasks)} videos.")
-
-    for vid_path, img_path, out_path in tasks:
-        try:
-            # Metrics: Add duration
-            dur = get_vid_duration(vid_path)
-            total_video_duration_processed += dur
-
-            process_single_video(
-                vid_path,
-                img_path,
-                out_path,
-                position,
-                scale,
-                margin,
-                start_percent,
-                duration_sec,
-                fade_in,
-                fade_out,
-                mode,
-                overwrite,
-                threads,
-            )
-            videos_processed_count += 1
-        except Exception as e:
-            logger.error(f"Failed to process {os.path.basename(vid_path)}: {e}")
+    # Metrics: Add duration (headers probed concurrently, then read from the cache)
+    prefetch_probes([vid_path for vid_path, _, _ in tasks])
+    for vid_path, _, _ in tasks:
+        total_video_duration_processed += get_vid_duration(vid_path)
+
+    # Parallel jobs get an even share of the cores unless --threads is set
+    workers = resolve_workers(jobs, threads or 2, len(tasks))
+    if workers > 1 and threads is None:
+        defaults["threads"] = max(1, (os.process_cpu_count() or 4) // workers)
+
+    # One logo for the whole batch: read it once and hand every job the bytes
+    # (FFmpeg gets them on stdin, the Python engines decode them in memory)
+    task_images = {img_path for _, img_path, _ in tasks}
+    if len(task_images) == 1:
+        with open(task_images.pop(), "rb") as f:
+            defaults["image_bytes"] = f.read()
+
+    logger.info(f"Starting queue: {len(tasks)} videos on {workers} workers.")
+    task_jobs = [
+        {**defaults, "video": vid_path, "image": img_path, "out": out_path}
+        for vid_path, img_path, out_path in tasks
+    ]
+    if group_size > 1 and mode == "ffmpeg":
+        videos_processed_count, _, task_jobs = run_grouped_ffmpeg(task_jobs, group_size)
+    processed, _ = run_jobs(task_jobs, workers)
+    videos_processed_count += processed
 
     # --- FINAL METRICS LOGGING ---
-    process_end_time = time.time()
-    execution_time_seconds = process_end_time - process_start_time
-
-    # Format times to HH:MM:SS
-    exec_time_str = str(timedelta(seconds=int(execution_time_seconds)))
-    video_time_str = str(timedelta(seconds=int(total_video_duration_processed)))
-
-    print("-" * 40)
-    print("PROCESSING SUMMARY")
-    print("-" * 40)
-    print(f"Total Videos Processed: {videos_processed_count}")
-    print(f"Total Video Content:    {video_time_str} (HH:MM:SS)")
-    print(f"Total Execution Time:   {exec_time_str} (HH:MM:SS)")
-    print("-" * 40)
+    print_summary(
+        videos_processed_count,
+        total_video_duration_processed,
+        time.time() - process_start_time,
+    )
 
 
 if __name__ == "__main__":
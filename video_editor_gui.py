@@ -1,15 +1,23 @@
 import os
 import sys
-import glob
 import logging
+import logging.handlers
+import queue
+import atexit
+import signal
 import time
 import datetime
 import threading
+import functools
+import multiprocessing
+import asyncio
+import json
+from concurrent.futures import ProcessPoolExecutor
 
-
-import gradio as gr
-
-import video_brand_automator as engine
+# gradio and the engine are imported where first used (build_interface,
+# run_processing_job): both pull in large import graphs (FastAPI, NumPy...)
+# that slow the packaged app's start-up, and the pool workers re-import this
+# module without ever needing gradio.
 
 
 # ---------------------------------------------------------------------------
@@ -35,37 +43,123 @@ if sys.stdout is None:
 # 1. LOGGING SETUP (File Persistence)
 # ---------------------------------------------------------------------------
 LOG_FILENAME = "video_brander_logs.txt"
+LOG_FLUSH_SECONDS = 5  # Longest a buffered record waits before reaching the disk
+
+# Writes the queued log records to disk on its own thread (see setup_file_logging)
+log_listener = None
+log_buffer = None
+
+
+class BufferedFileHandler(logging.FileHandler):
+    """
+    FileHandler with a 128 KB write buffer and no flush per record.
+    Records reach the disk in batches, when flush() is called.
+    """
+
+    def _open(self):
+        return open(
+            self.baseFilename,
+            self.mode,
+            buffering=128 * 1024,
+            encoding=self.encoding,
+            errors=self.errors,
+        )
+
+    def emit(self, record):
+        if self.stream is None:
+            self.stream = self._open()
+        try:
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class BatchMemoryHandler(logging.handlers.MemoryHandler):
+    """
+    MemoryHandler that also flushes its target's file after each batch.
+    A record logged with extra={"flush": True} is written out right away too.
+    """
+
+    def shouldFlush(self, record):
+        return super().shouldFlush(record) or getattr(record, "flush", False)
+
+    def flush(self):
+        super().flush()
+        if self.target:
+            self.target.flush()
+
+
+def _flush_periodically(handler, seconds):
+    while True:
+        time.sleep(seconds)
+        handler.flush()
 
 
 def setup_file_logging():
     """
-    Configures logging to write to a file with a session header.
+    Configures logging to write to a file.
+    Pool workers re-import this module and log to the same file.
     """
-    # 1. Create a file handler
-    file_handler = logging.FileHandler(LOG_FILENAME, mode="a", encoding="utf-8")
+    global log_listener, log_buffer
+
+    # 1. Create a file handler, fed from a queue by a background listener:
+    # loggers only enqueue records, the disk writes happen off the job loop
+    file_handler = BufferedFileHandler(LOG_FILENAME, mode="a", encoding="utf-8")
     formatter = logging.Formatter(
         "%(asctime)s - [%(levelname)s] - %(message)s", datefmt="%Y-%m-%d %H:%M:%S"
     )
     file_handler.setFormatter(formatter)
 
+    # Records are written in batches: every 1024 records, on an error, or
+    # every LOG_FLUSH_SECONDS (bounds what a crash can lose)
+    log_buffer = BatchMemoryHandler(
+        capacity=1024,
+        flushLevel=logging.ERROR,
+        target=file_handler,
+        flushOnClose=True,
+    )
+    threading.Thread(
+        target=_flush_periodically, args=(log_buffer, LOG_FLUSH_SECONDS), daemon=True
+    ).start()
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    log_listener = logging.handlers.QueueListener(
+        log_queue, log_buffer, respect_handler_level=True
+    )
+    log_listener.start()
+    atexit.register(log_listener.stop)  # Drains the queue on exit
+
     # 2. Attach to the Engine's logger (so we capture the backend logic)
     engine_logger = logging.getLogger("VideoAutomator")
-    engine_logger.addHandler(file_handler)
+    engine_logger.addHandler(queue_handler)
 
     # 3. Create a GUI logger for high-level events
     gui_logger = logging.getLogger("GUI")
     gui_logger.setLevel(logging.INFO)
-    gui_logger.addHandler(file_handler)
+    gui_logger.addHandler(queue_handler)
+
+    return gui_logger
+
 
-    # 4. Write Session Header
+def write_session_header():
+    """
+    Marks a new app session in the log file (main process only, not the workers).
+    """
     separator = "=" * 50
     header = f"\n{separator}\nSESSION START: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n{separator}"
 
-    # Write directly to file to ensure header exists even if logging is silent
-    with open(LOG_FILENAME, "a", encoding="utf-8") as f:
-        f.write(header + "\n")
-
-    return gui_logger
+    # Written (and flushed) through the log handler's own stream, not a second
+    # open() of the file, so it can't interleave with buffered records.
+    # Flushed right away to ensure header exists even if logging is silent.
+    file_handler = log_buffer.target
+    log_buffer.flush()  # Records logged before the header stay before it
+    file_handler.acquire()
+    try:
+        file_handler.stream.write(header + "\n")
+        file_handler.stream.flush()
+    finally:
+        file_handler.release()
 
 
 # Initialize Logger
@@ -76,6 +170,7 @@ gui_logger = setup_file_logging()
 # ---------------------------------------------------------------------------
 
 
+@functools.lru_cache(maxsize=1)
 def get_base_path():
     """
     Returns the folder where the script (or .exe) is running.
@@ -87,26 +182,74 @@ def get_base_path():
     return os.path.dirname(os.path.abspath(__file__))
 
 
+# Default folders, resolved once
+BASE_DIR = get_base_path()
+DEFAULT_VIDEO_DIR = os.path.join(BASE_DIR, "videos")
+DEFAULT_IMAGE_DIR = os.path.join(BASE_DIR, "images")
+OUTPUT_DIR = os.path.join(BASE_DIR, "output")
+
+# Kept in the output folder: the settings each output was rendered with
+SETTINGS_FILENAME = ".render_settings.json"
+
+# Shortest gap between two log updates sent to the browser: a burst of finished
+# videos becomes one update instead of one round-trip per line
+YIELD_MIN_INTERVAL = 0.1
+
+
+def load_output_settings(folder):
+    """
+    {output file name: settings it was rendered with} from earlier runs.
+    """
+    try:
+        with open(os.path.join(folder, SETTINGS_FILENAME), encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+
+def save_output_settings(folder, settings):
+    path = os.path.join(folder, SETTINGS_FILENAME)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(settings, f)
+    os.replace(tmp_path, path)  # A cancelled run never leaves half a file
+
+
+def _exit_now(*_signal):
+    """
+    Ends the process right away. Also the SIGTERM handler, so process managers
+    shut the app down the same way the Exit button does.
+    """
+    gui_logger.info("Shutdown sequence complete. Exiting.")
+    # os._exit skips atexit: drain the log queue and buffer first
+    log_listener.stop()
+    log_buffer.flush()
+    os._exit(0)
+
+
 def kill_app():
     """
     Gracefully kills the app.
-    Spawns a background thread to kill the process after 1 second,
+    Exits from a timer thread after 1 second,
     allowing this function to return successfully to the browser first.
     """
-
-    def _shutdown():
-        time.sleep(1.0)  # Wait for browser to receive the "OK"
-        gui_logger.info("Shutdown sequence complete. Exiting.")
-        os._exit(0)
-
-    # Start the countdown in the background
-    threading.Thread(target=_shutdown).start()
+    # Wait for browser to receive the "OK"
+    timer = threading.Timer(1.0, _exit_now)
+    timer.daemon = True
+    timer.start()
 
     # Return immediately so the browser sees a "Success" state
     return "⚡ Shutting down... You can close this tab now."
 
 
-def run_processing_job(
+def _worker(call, video, out):
+    """
+    Runs one video in a pool process. Top-level so it pickles into the pool.
+    """
+    call(video=video, out=out)
+
+
+async def run_processing_job(
     folder_path_input,
     image_path_input,
     margin_pct,
@@ -115,16 +258,38 @@ def run_processing_job(
     duration,
     scale_input,
     mode_selection,
+    skip_if_fresh=False,
 ):
     """
     The Bridge Logic:
     1. Resolves paths (uses Defaults if inputs are empty).
     2. Finds files.
-    3. Calls the engine's process_single_video() in a loop.
+    3. Runs the engine's process_single_video() on a process pool, skipping
+       videos whose output is newer than both the video and the image and
+       was rendered with the same settings.
     4. Yields real-time logs to the GUI.
+    An async generator: the event loop keeps serving other requests (e.g. Exit)
+    while the videos render.
     """
-    base_dir = get_base_path()
-    logs = []
+    import video_brand_automator as engine
+
+    # Log shown in the GUI, grown line by line (no re-join of every line per update)
+    log_text = ""
+
+    def push(line):
+        nonlocal log_text
+        log_text += ("\n" if log_text else "") + line
+
+    last_yield = 0.0
+
+    def due(force=False):
+        """True if the log should be sent to the GUI now (see YIELD_MIN_INTERVAL)."""
+        nonlocal last_yield
+        now = time.monotonic()
+        if force or now - last_yield >= YIELD_MIN_INTERVAL:
+            last_yield = now
+            return True
+        return False
 
     gui_logger.info(f"Job started. Mode: {mode_selection}")
 
@@ -133,65 +298,69 @@ def run_processing_job(
     # A. Video Folder
     video_folder = folder_path_input.strip()
     if not video_folder:
-        video_folder = os.path.join(base_dir, "videos")
-        logs.append(f"ℹ️ Input empty. Using default folder: {video_folder}")
+        video_folder = DEFAULT_VIDEO_DIR
+        push(f"ℹ️ Input empty. Using default folder: {video_folder}")
 
     # B. Image File
     overlay_image = image_path_input
     if not overlay_image:
-        default_img_dir = os.path.join(base_dir, "images")
-        # Find first valid image
-        possibles = glob.glob(os.path.join(default_img_dir, "*"))
-        valid_imgs = [
-            f
-            for f in possibles
-            if f.lower().endswith((".png", ".jpg", ".jpeg", ".webp"))
-        ]
-
-        if valid_imgs:
-            overlay_image = valid_imgs[0]
-            logs.append(
-                f"ℹ️ Image empty. Using default: {os.path.basename(overlay_image)}"
-            )
+        # First image by name, same order as the CLI
+        if os.path.isdir(DEFAULT_IMAGE_DIR):
+            imgs = engine.list_images(DEFAULT_IMAGE_DIR)
+            if imgs:
+                overlay_image = imgs[0]
+
+        if overlay_image:
+            push(f"ℹ️ Image empty. Using default: {os.path.basename(overlay_image)}")
         else:
             msg = "❌ Error: No image provided and none found in ./images"
             gui_logger.error(msg)
-            yield "\n".join(logs) + "\n" + msg
+            yield log_text + "\n" + msg
             return
 
     # --- 2. VALIDATION ---
-    if not os.path.exists(video_folder):
+    if not os.path.isdir(video_folder):
         msg = f"❌ Error: Video folder not found: {video_folder}"
         gui_logger.error(msg)
-        yield "\n".join(logs) + "\n" + msg
+        yield log_text + "\n" + msg
         return
 
-    if not os.path.exists(overlay_image):
+    if not os.path.isfile(overlay_image):
         msg = f"\n❌ Error: Image not found: {overlay_image}"
         gui_logger.error(msg)
-        yield "\n".join(logs) + "\n" + msg
+        yield log_text + "\n" + msg
+        return
+
+    # Header-only check (no pixel decode): a corrupt image fails here once,
+    # not in every video of the batch. Pillow ships with MoviePy and Gradio.
+    from PIL import Image
+
+    try:
+        with Image.open(overlay_image) as img:
+            img.verify()
+    except Exception as e:
+        msg = f"❌ Error: Unreadable image: {overlay_image} ({e})"
+        gui_logger.error(msg)
+        yield log_text + "\n" + msg
         return
 
     # Create Output Folder (default to ./output inside the source folder or root)
-    output_folder = os.path.join(base_dir, "output")
+    output_folder = OUTPUT_DIR
     os.makedirs(output_folder, exist_ok=True)
 
     # --- 3. DISCOVERY ---
-    video_extensions = ("*.mp4", "*.mov", "*.mkv", "*.avi", "*.webm")
-    video_files = []
-    for ext in video_extensions:
-        video_files.extend(glob.glob(os.path.join(video_folder, ext)))
+    video_files = engine.list_videos(video_folder)
 
     if not video_files:
         msg = f"⚠️ No videos found in {video_folder}"
         gui_logger.warning(msg)
-        yield "\n".join(logs) + "\n" + msg
+        yield log_text + "\n" + msg
         return
 
     msg_start = f"✅ Found {len(video_files)} videos. Starting Batch..."
     gui_logger.info(msg_start)
-    logs.append(msg_start)
-    yield "\n".join(logs)
+    push(msg_start)
+    yield log_text
 
     # --- 4. EXECUTION LOOP ---
     success_count = 0
@@ -202,49 +371,126 @@ def run_processing_job(
     # Convert margin from integer 5 to float 0.05
     final_margin = float(margin_pct) / 100.0
 
-    for i, vid_path in enumerate(video_files, 1):
-        filename = os.path.basename(vid_path)
-        name_only = os.path.splitext(filename)[0]
-        out_path = os.path.join(output_folder, f"{name_only}_branded.mp4")
-
-        # Stream update
-        current_log = f"⏳ [{i}/{total}] Processing: {filename}..."
-        yield "\n".join(logs + [current_log])
+    # (video, file name, output) for every video, built in one pass up front
+    names = [os.path.basename(vid_path) for vid_path in video_files]
+    outputs = [
+        (
+            vid_path,
+            name,
+            os.path.join(output_folder, f"{os.path.splitext(name)[0]}_branded.mp4"),
+        )
+        for vid_path, name in zip(video_files, names)
+    ]
+
+    # Everything that changes the output, shared by the whole batch
+    render_settings = {
+        "image": overlay_image,
+        "position": position,  # e.g., "center"
+        "scale": final_scale,  # e.g., None or 0.5
+        "margin": final_margin,  # e.g., 0.05
+        "start_percent": start_pct,  # e.g., 75.0
+        "duration_sec": duration,  # e.g., 5.0
+        "fade_in": 0.5,  # Hardcoded polish
+        "fade_out": 0.5,
+        "mode": mode_selection.lower(),  # "ffmpeg" or "moviepy"
+    }
+    settings_id = repr(sorted(render_settings.items()))
+
+    # Outputs newer than their inputs and made with these settings are kept
+    # (re-runs only redo what changed)
+    rendered_with = load_output_settings(output_folder)
+    image_mtime = os.stat(overlay_image).st_mtime
+    i = 0
+    jobs = {}
+    for vid_path, filename, out_path in outputs:
+        out_name = os.path.basename(out_path)
+        if (
+            skip_if_fresh
+            and rendered_with.get(out_name) == settings_id
+            and os.path.isfile(out_path)
+        ):
+            newest_input = max(os.stat(vid_path).st_mtime, image_mtime)
+            if os.stat(out_path).st_mtime >= newest_input:
+                i += 1
+                success_count += 1
+                push(f"⏭️ [{i}/{total}] Skipped (up to date): {filename}")
+                continue
+        jobs[filename] = (vid_path, out_path)
+
+    # Videos are independent: one per worker, each encoder on a few threads
+    # (one worker per 2 cores, so parallel encoders don't oversubscribe the CPU)
+    workers = engine.resolve_workers("auto", 2, len(jobs))
+    # Settings shared by the whole batch, bound once; only video/out vary per call
+    call = functools.partial(
+        engine.process_single_video,
+        **render_settings,
+        overwrite=True,
+        threads=2 if workers > 1 else 4,
+    )
 
-        try:
-            # CALL THE ENGINE
-            engine.process_single_video(
-                video=vid_path,
-                image=overlay_image,
-                out=out_path,
-                position=position,  # e.g., "center"
-                scale=final_scale,  # e.g., None or 0.5
-                margin=final_margin,  # e.g., 0.05
-                start_percent=start_pct,  # e.g., 75.0
-                duration_sec=duration,  # e.g., 5.0
-                fade_in=0.5,  # Hardcoded polish
-                fade_out=0.5,
-                mode=mode_selection.lower(),  # "ffmpeg" or "moviepy"
-                overwrite=True,
-                threads=4,
+    # Stream update
+    if jobs:
+        push(f"⏳ Processing {len(jobs)} videos on {workers} workers...")
+    yield log_text
+
+    # 'spawn' like the engine's CLI: forked workers would inherit Gradio's threads
+    context = multiprocessing.get_context("spawn")
+    loop = asyncio.get_running_loop()
+    executor = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    try:
+        # CALL THE ENGINE
+        futures = {
+            loop.run_in_executor(executor, _worker, call, vid_path, out_path): filename
+            for filename, (vid_path, out_path) in jobs.items()
+        }
+        pending = set(futures)
+        held = False  # Lines pushed but not sent yet (see due())
+        while pending:
+            # Wake up when the held lines are due, even if no video finishes
+            timeout = None
+            if held:
+                timeout = max(0.0, last_yield + YIELD_MIN_INTERVAL - time.monotonic())
+            done, pending = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
             )
-            success_count += 1
-            logs.append(f"✔️ Finished: {filename}")
-
-        except Exception as e:
-            err_msg = f"❌ Failed: {filename} ({str(e)})"
-            gui_logger.error(err_msg)
-            logs.append(err_msg)
-
-        yield "\n".join(logs)
+            failed = False
+            for future in done:
+                i += 1
+                filename = futures[future]
+                try:
+                    future.result()
+                    success_count += 1
+                    push(f"✔️ [{i}/{total}] Finished: {filename}")
+                    rendered_with[os.path.basename(jobs[filename][1])] = settings_id
+                    save_output_settings(output_folder, rendered_with)
+
+                except Exception as e:
+                    err_msg = f"❌ [{i}/{total}] Failed: {filename} ({str(e)})"
+                    gui_logger.error(err_msg)
+                    push(err_msg)
+                    failed = True
+
+            # Errors show up right away, held lines once their interval is up
+            held = True
+            if due(force=failed or not done):
+                held = False
+                yield log_text
+
+        if held:
+            yield log_text
+    finally:
+        # Not a `with` block: its shutdown(wait=True) would block the event loop
+        # (and the whole GUI) until every queued video rendered when the run is
+        # cancelled (tab closed, stop). Queued videos are dropped instead.
+        executor.shutdown(wait=False, cancel_futures=True)
 
     # Final Summary
     final_msg = f"🎉 Batch Complete. {success_count}/{total} videos processed."
-    gui_logger.info(final_msg)
-    logs.append("-" * 30)
-    logs.append(final_msg)
-    logs.append(f"📂 Output Folder: {output_folder}")
-    yield "\n".join(logs)
+    gui_logger.info(final_msg, extra={"flush": True})  # Persisted as the batch ends
+    push("-" * 30)
+    push(final_msg)
+    push(f"📂 Output Folder: {output_folder}")
+    yield log_text
 
 
 # ---------------------------------------------------------------------------
@@ -253,6 +499,8 @@ def run_processing_job(
 
 
 def build_interface():
+    import gradio as gr
+
     with gr.Blocks(title="Video Brand Automator") as app:
         gr.Markdown("# 🎥 Video Branding Tool")
         gr.Markdown(
@@ -292,6 +540,10 @@ def build_interface():
                         )
                         duration_num = gr.Number(value=5, label="Duration (s)")
 
+                    skip_fresh_check = gr.Checkbox(
+                        label="Skip if output is up-to-date", value=True
+                    )
+
                     pos_dropdown = gr.Dropdown(
                         [
                             "center",
@@ -332,6 +584,7 @@ def build_interface():
                 duration_num,
                 scale_num,
                 mode_select,
+                skip_fresh_check,
             ],
             outputs=output_log,
         )
@@ -341,6 +594,9 @@ def build_interface():
 
 
 if __name__ == "__main__":
+    multiprocessing.freeze_support()  # Worker processes of the PyInstaller .exe
+    write_session_header()
+    signal.signal(signal.SIGTERM, _exit_now)
     app = build_interface()
     # allow_flagging="never" is handled inside Blocks implicitly by not adding flag buttons
     app.launch(inbrowser=True)